@@ -0,0 +1,371 @@
+"""
+Бенчмарки бекенду (офлайн, CPU):
+  predict_single   — greedy-декодинг одного X (кеш K/V; --uncached додає еталонний повний forward)
+  predict_batched  — батчевий greedy-декодинг
+  predict_mixed    — батч X різної довжини: маска доповнення vs доповнення нулями до 441
+  predict_nar      — Mask-Predict (1 і --nar-iterations проходів) поряд із greedy; лише латентність
+  train_epochs     — Trainer.fit, N епох на одному семплі
+  train_once       — старий крок train_once (новий Adam щоразу)
+  train_ddp        — епоха по синтетичному корпусу: 1 процес vs DDP на --ddp-workers процесах
+  parse_upload     — парсинг зразкових файлів з data/datasets і синтетичного CSV
+
+Кожен сценарій виконується в окремому процесі (чистий пік пам'яті).
+Результат — JSON: перцентилі латентності, пропускна здатність, пік RSS / tracemalloc.
+Латентність міряється без tracemalloc; пік Python-алокацій — окремим прогоном (--repeats 1)
+після замірів (--no-alloc-pass — пропустити). Процес, що впав або не вклався в --timeout,
+дає сценарій з error і exitcode.
+
+    python bench.py --out bench.json
+    python bench.py --scenarios predict_single,parse_upload --repeats 10
+"""
+import argparse
+import copy
+import io
+import json
+import multiprocessing as mp
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from queue import Empty
+from typing import Callable, Dict, List
+
+import numpy as np
+import torch
+
+BASE_DIR: Path = Path(__file__).resolve().parent
+DATASETS_DIR: Path = BASE_DIR / "data" / "datasets"
+SEQ_LEN = 441
+
+
+# ───────── Вимірювання ─────────
+def _percentiles(samples_s: List[float]) -> dict:
+    ms = sorted(1000.0 * s for s in samples_s)
+    return {
+        "n": len(ms),
+        "mean_ms": statistics.fmean(ms),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p90_ms": float(np.percentile(ms, 90)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "min_ms": ms[0],
+        "max_ms": ms[-1],
+    }
+
+
+def _measure(fn: Callable[[], None], repeats: int, warmup: int = 1) -> List[float]:
+    for _ in range(warmup):
+        fn()
+    out = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        out.append(time.perf_counter() - t0)
+    return out
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux — КБ, macOS — байти
+    return rss / (1024.0 * 1024.0) if sys.platform == "darwin" else rss / 1024.0
+
+
+def _synthetic_xy(n: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    x = torch.from_numpy(rng.random((n, SEQ_LEN), dtype=np.float32))
+    y = torch.from_numpy(rng.integers(0, 3, size=(n, SEQ_LEN)).astype(np.int64))
+    return x, y
+
+
+def _model():
+    from model.transformer_model import SimpleTransformer
+
+    torch.manual_seed(0)
+    return SimpleTransformer(input_seq_len=SEQ_LEN, target_seq_len=SEQ_LEN).eval()
+
+
+# ───────── Сценарії ─────────
+def bench_predict_single(args) -> dict:
+    from model.transformer_model import predict_tokens_greedy
+
+    model = _model()
+    x, _ = _synthetic_xy(1)
+    lat = _measure(lambda: predict_tokens_greedy(model, x, max_len=SEQ_LEN), args.repeats)
+    out = {"latency": _percentiles(lat), "throughput_per_s": len(lat) / sum(lat), "tokens_per_s": SEQ_LEN * len(lat) / sum(lat)}
+    if args.uncached:
+        lat_ref = _measure(lambda: predict_tokens_greedy(model, x, max_len=SEQ_LEN, use_cache=False), max(1, args.repeats // 5), warmup=0)
+        out["uncached_latency"] = _percentiles(lat_ref)
+        out["speedup_vs_uncached"] = statistics.fmean(lat_ref) / statistics.fmean(lat)
+    return out
+
+
+def bench_predict_batched(args) -> dict:
+    from model.transformer_model import predict_tokens_greedy_batch
+
+    model = _model()
+    x, _ = _synthetic_xy(args.batch_size)
+    lat = _measure(lambda: predict_tokens_greedy_batch(model, x, max_len=SEQ_LEN), args.repeats)
+    return {
+        "batch_size": args.batch_size,
+        "latency": _percentiles(lat),
+        "throughput_per_s": args.batch_size * len(lat) / sum(lat),
+    }
+
+
+def bench_predict_mixed(args) -> dict:
+    from model.transformer_model import pad_batch, predict_tokens_greedy_batch
+
+    model = _model()
+    rng = np.random.default_rng(0)
+    lengths = rng.integers(32, SEQ_LEN + 1, size=args.batch_size)
+    xs = [torch.from_numpy(rng.random(int(n), dtype=np.float32)) for n in lengths]
+    x, mask = pad_batch(xs)
+    x_full = torch.zeros((len(xs), SEQ_LEN))
+    x_full[:, : x.shape[1]] = x
+    lat = _measure(lambda: predict_tokens_greedy_batch(model, x, max_len=SEQ_LEN, src_key_padding_mask=mask), args.repeats)
+    lat_full = _measure(lambda: predict_tokens_greedy_batch(model, x_full, max_len=SEQ_LEN), args.repeats)
+    return {
+        "batch_size": args.batch_size,
+        "x_lengths": lengths.tolist(),
+        "masked_latency": _percentiles(lat),
+        "padded_441_latency": _percentiles(lat_full),
+        "throughput_per_s": args.batch_size * len(lat) / sum(lat),
+    }
+
+
+def bench_predict_nar(args) -> dict:
+    from model.nar import MaskPredictHead, mask_predict
+
+    model = _model()
+    torch.manual_seed(0)
+    head = MaskPredictHead.for_model(model).eval()
+    x, _ = _synthetic_xy(1)
+    lat_one = _measure(lambda: mask_predict(model, head, x, iterations=1), args.repeats)
+    lat_iter = _measure(lambda: mask_predict(model, head, x, iterations=args.nar_iterations), args.repeats)
+    return {
+        "single_pass_latency": _percentiles(lat_one),
+        "iterative_latency": _percentiles(lat_iter),
+        "iterations": args.nar_iterations,
+        "throughput_per_s": len(lat_iter) / sum(lat_iter),
+    }
+
+
+def bench_train_epochs(args) -> dict:
+    from model.trainer import Trainer
+
+    trainer = Trainer(_model().train(), lr=1e-3)
+    x, y = _synthetic_xy(1)
+    lat = []
+    losses = []
+    for _ in range(args.repeats):
+        t0 = time.perf_counter()
+        losses = trainer.fit(x, y, epochs=args.epochs)
+        lat.append((time.perf_counter() - t0) / args.epochs)
+    return {
+        "epochs_per_run": args.epochs,
+        "epoch_latency": _percentiles(lat),
+        "epochs_per_s": len(lat) / sum(lat),
+        "final_loss": losses[-1] if losses else None,
+    }
+
+
+def bench_train_once(args) -> dict:
+    from model.transformer_model import train_once
+
+    model = _model().train()
+    x, y = _synthetic_xy(1)
+    lat = _measure(lambda: train_once(model, x, y, lr=1e-3), args.repeats * args.epochs, warmup=1)
+    return {"step_latency": _percentiles(lat), "steps_per_s": len(lat) / sum(lat)}
+
+
+def bench_train_ddp(args) -> dict:
+    from model.dataset_store import DatasetStore
+    from model.distributed import fit_dataset_ddp
+    from model.trainer import Trainer
+
+    x, y = _synthetic_xy(args.ddp_samples)
+    out = {"samples": args.ddp_samples, "batch_size": args.ddp_batch_size, "epochs": args.epochs, "runs": {}}
+    with tempfile.TemporaryDirectory() as root:
+        store = DatasetStore(root)
+        for xi, yi in zip(x.numpy(), y.numpy()):
+            store.append(xi, yi.tolist())
+
+        base = None
+        for world in sorted({int(w) for w in args.ddp_workers.split(",") if w.strip()}):
+            trainer = Trainer(_model().train(), lr=1e-3)
+            t0 = time.perf_counter()
+            if world <= 1:
+                losses = trainer.fit_dataset(store, epochs=args.epochs, batch_size=args.ddp_batch_size, seed=0)
+            else:
+                losses = fit_dataset_ddp(
+                    trainer, store, epochs=args.epochs, world_size=world, batch_size=args.ddp_batch_size, seed=0
+                )
+            elapsed = time.perf_counter() - t0
+            base = base or elapsed
+            out["runs"][str(world)] = {
+                "wall_s": elapsed,
+                "epoch_s": elapsed / args.epochs,
+                "samples_per_s": args.ddp_samples * args.epochs / elapsed,
+                "speedup": base / elapsed,
+                "final_loss": losses[-1] if losses else None,
+            }
+    return out
+
+
+def bench_parse_upload(args) -> dict:
+    from model.ingest import iter_x_row_chunks_csv
+    from model.utils import parse_XY_from_tabular
+
+    out = {}
+    for name in ("base_dataset.xlsx", "base_X.csv", "base_Y.csv"):
+        path = DATASETS_DIR / name
+        if not path.exists():
+            continue
+        content = path.read_bytes()
+        lat = _measure(lambda: parse_XY_from_tabular(io.BytesIO(content), name), args.repeats)
+        out[name] = {"bytes": len(content), "latency": _percentiles(lat)}
+
+    # синтетичний CSV: args.rows рядків × 441 ознака, потокове читання чанками
+    x, _ = _synthetic_xy(args.rows)
+    buf = io.StringIO()
+    np.savetxt(buf, x.numpy(), delimiter=",", fmt="%.6f", header=",".join(str(i) for i in range(SEQ_LEN)), comments="")
+    data = buf.getvalue().encode()
+    lat = _measure(lambda: sum(len(c) for c in iter_x_row_chunks_csv(data)), args.repeats)
+    out["synthetic_csv"] = {
+        "rows": args.rows,
+        "bytes": len(data),
+        "latency": _percentiles(lat),
+        "rows_per_s": args.rows * len(lat) / sum(lat),
+    }
+    return out
+
+
+SCENARIOS: Dict[str, Callable] = {
+    "predict_single": bench_predict_single,
+    "predict_batched": bench_predict_batched,
+    "predict_mixed": bench_predict_mixed,
+    "predict_nar": bench_predict_nar,
+    "train_epochs": bench_train_epochs,
+    "train_once": bench_train_once,
+    "train_ddp": bench_train_ddp,
+    "parse_upload": bench_parse_upload,
+}
+
+
+# ───────── Запуск ─────────
+def _run_scenario(name: str, args, queue):
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    t0 = time.perf_counter()
+    try:
+        result = SCENARIOS[name](args)
+        error = None
+    except Exception as e:
+        result, error = {}, f"{type(e).__name__}: {e}"
+    wall_s = time.perf_counter() - t0
+    peak_rss_mb = _peak_rss_mb()  # до прогону з tracemalloc — лише заміряний прогін
+
+    py_peak = None
+    if error is None and not args.no_alloc_pass:
+        # окремий незаміряний прогін: tracemalloc сповільнює кожну алокацію
+        mem_args = copy.copy(args)
+        mem_args.repeats = 1
+        tracemalloc.start()
+        try:
+            SCENARIOS[name](mem_args)
+            py_peak = tracemalloc.get_traced_memory()[1] / (1024.0 * 1024.0)
+        except Exception:
+            pass
+        finally:
+            tracemalloc.stop()
+    result.update({
+        "wall_s": wall_s,
+        "peak_rss_mb": peak_rss_mb,
+        "peak_python_alloc_mb": py_peak,
+        "error": error,
+    })
+    queue.put(result)
+
+
+def _collect(proc, queue, timeout_s: float) -> dict:
+    """Результат сценарію; якщо процес упав (напр. OOM-kill) або не вклався в timeout — запис з error."""
+    deadline = time.monotonic() + timeout_s
+    while True:
+        try:
+            return queue.get(timeout=1.0)
+        except Empty:
+            pass
+        if not proc.is_alive():
+            try:
+                return queue.get(timeout=1.0)  # міг встигнути покласти результат перед виходом
+            except Empty:
+                return {"wall_s": None, "error": f"процес сценарію завершився без результату (exitcode={proc.exitcode})"}
+        if time.monotonic() > deadline:
+            proc.kill()
+            return {"wall_s": None, "error": f"сценарій не вклався в {timeout_s:.0f} с"}
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Бенчмарки декодингу, навчання і парсингу (CPU)")
+    p.add_argument("--scenarios", default=",".join(SCENARIOS), help="через кому; доступні: " + ", ".join(SCENARIOS))
+    p.add_argument("--repeats", type=int, default=5)
+    p.add_argument("--epochs", type=int, default=10, help="епох на прогін train_epochs / кроків на повтор train_once")
+    p.add_argument("--batch-size", type=int, default=8)
+    p.add_argument("--rows", type=int, default=2000, help="рядків у синтетичному CSV для parse_upload")
+    p.add_argument("--threads", type=int, default=0, help="torch.set_num_threads (0 — за замовчуванням)")
+    p.add_argument("--nar-iterations", type=int, default=4, help="проходів Mask-Predict для predict_nar")
+    p.add_argument("--ddp-workers", default="1,2,4", help="кількості процесів для train_ddp (1 — без DDP, база)")
+    p.add_argument("--ddp-samples", type=int, default=128, help="семплів у синтетичному корпусі train_ddp")
+    p.add_argument("--ddp-batch-size", type=int, default=32, help="глобальний батч train_ddp")
+    p.add_argument("--uncached", action="store_true", help="додати повільний еталонний декодинг без кешу")
+    p.add_argument("--timeout", type=float, default=3600.0, help="ліміт на сценарій, с")
+    p.add_argument("--no-alloc-pass", action="store_true", help="не робити прогін з tracemalloc (peak_python_alloc_mb=null)")
+    p.add_argument("--out", default=None, help="файл для JSON (інакше — stdout)")
+    args = p.parse_args(argv)
+
+    names = [n.strip() for n in args.scenarios.split(",") if n.strip()]
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        p.error(f"невідомі сценарії: {', '.join(unknown)}")
+
+    ctx = mp.get_context("spawn")
+    results = {}
+    for name in names:
+        queue = ctx.Queue()
+        proc = ctx.Process(target=_run_scenario, args=(name, args, queue))
+        proc.start()
+        results[name] = _collect(proc, queue, args.timeout)
+        proc.join()
+        results[name].setdefault("exitcode", proc.exitcode)
+        wall = results[name]["wall_s"]
+        status = f"{wall:.1f} s" if wall is not None else results[name]["error"]
+        print(f"[bench] {name}: {status}", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": mp.cpu_count(),
+            "torch_threads": args.threads or torch.get_num_threads(),
+            "args": vars(args),
+        },
+        "scenarios": results,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        Path(args.out).write_text(text, encoding="utf-8")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
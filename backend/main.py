@@ -1,26 +1,48 @@
-import io
-from typing import List, Optional
+import asyncio
+import copy
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import AsyncIterator, Iterator, List, Literal, Optional
 
 import torch
-from fastapi import FastAPI, UploadFile, File, Form
+from fastapi import FastAPI, UploadFile, File, Form, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Match
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
 from pathlib import Path
 from datetime import datetime
 
 from model.transformer_model import (
     SimpleTransformer,
-    train_once,
-    predict_tokens_greedy,
+    predict_tokens_greedy_batch,
     START_TOKEN,
     VOCAB_SIZE,
 )
-from model.utils import (
-    load_model,
-    save_model,
-    parse_X_from_tabular,
-    parse_XY_from_tabular,
-)
+from model.utils import load_model
+from model.uploads import SpooledUpload, spool_upload
+from model.worker_pool import InferenceWorkerPool
+from model.batching import MicroBatcher
+from model.jobs import JobCancelled, TrainingJob, TrainingJobManager
+from model.trainer import EarlyStopping, Trainer
+from model.distributed import fit_dataset_ddp
+from model.dataset_store import DatasetStore
+from model.dataset_logger import DatasetLogger
+from model.prediction_cache import PredictionCache
+from model.registry import ModelRegistry, ModelSnapshot
+from model.checkpoints import CheckpointStore
+from model.inference_opt import build_inference_model, compare_models, configure_threads, warm_up
+from model.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsRegistry
+from model.profiling import SamplingProfiler
+from model.positional import cache_stats as positional_cache_stats
+from model.wire import CONTENT_TYPE as WIRE_CONTENT_TYPE, WireFormatError, decode_x, decode_xy, encode_tokens
+from model.nar import MaskPredictHead, MaskPredictTrainer, compare_decoding, load_head, predict_batch_nar, save_head
 
 # ───────────────────────── FastAPI & CORS ─────────────────────────
 app = FastAPI(title="AI Architecture Service (FastAPI + PyTorch)")
@@ -38,32 +60,137 @@ app.add_middleware(
 BASE_DIR: Path = Path(__file__).resolve().parent
 DATA_DIR: Path = BASE_DIR / "data"                   # .../backend/data
 DATASETS_DIR: Path = DATA_DIR / "datasets"           # .../backend/data/datasets
-MODEL_PATH: Path = BASE_DIR / "saved_model.pth"      # .../backend/saved_model.pth
+MODEL_PATH: Path = BASE_DIR / "saved_model.pth"      # .../backend/saved_model.pth (старий формат, лише міграція)
+CHECKPOINT_DIR: Path = BASE_DIR / "checkpoints"      # .../backend/checkpoints (версіоновані чекпойнти)
+STORE_DIR: Path = DATA_DIR / "store"                 # .../backend/data/store (бінарний корпус X/Y)
+UPLOADS_DIR: Path = DATA_DIR / "uploads"             # .../backend/data/uploads (оригінали, {sha256}{ext})
+NAR_HEAD_PATH: Path = CHECKPOINT_DIR / "nar_head.pth"  # голова Mask-Predict (окремо від версій AR-моделі)
+PROFILES_DIR: Path = DATA_DIR / "profiles"           # .../backend/data/profiles (collapsed stacks профайлера)
 DATASETS_DIR.mkdir(parents=True, exist_ok=True)
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 
+# ──────────────────────── Налаштування (env) ───────────────────────
+PREDICT_MAX_BATCH: int = int(os.getenv("PREDICT_MAX_BATCH", "16"))
+PREDICT_BATCH_WINDOW_MS: float = float(os.getenv("PREDICT_BATCH_WINDOW_MS", "5"))
+PREDICT_BUCKET_WIDTH: int = int(os.getenv("PREDICT_BUCKET_WIDTH", "32"))  # X різної довжини в одному батчі; 0 — лише рівні
+PREDICT_CACHE_SIZE: int = int(os.getenv("PREDICT_CACHE_SIZE", "4096"))  # 0 — вимкнути кеш
+PREDICT_CACHE_TTL_S: float = float(os.getenv("PREDICT_CACHE_TTL_S", "3600"))
+INFERENCE_MODE: str = os.getenv("INFERENCE_MODE", "fp32")               # fp32 | int8 | compile
+INFERENCE_THREADS: int = int(os.getenv("INFERENCE_THREADS", "0"))         # 0 — за замовчуванням torch
+INFERENCE_INTEROP_THREADS: int = int(os.getenv("INFERENCE_INTEROP_THREADS", "0"))
+INFERENCE_WORKERS: int = int(os.getenv("INFERENCE_WORKERS", "0"))        # 0 — інференс у процесі API
+INFERENCE_WORKER_THREADS: int = int(os.getenv("INFERENCE_WORKER_THREADS", "1"))
+CHECKPOINT_KEEP: int = int(os.getenv("CHECKPOINT_KEEP", "5"))     # скільки останніх версій зберігати
+CHECKPOINT_KEEP_BEST: int = int(os.getenv("CHECKPOINT_KEEP_BEST", "2"))  # проміжних kind=best (окремо від історії)
+TRAIN_LR_GAMMA: float = float(os.getenv("TRAIN_LR_GAMMA", "1.0"))  # <1 — ExponentialLR по епохах
+TRAIN_LR_PLATEAU_PATIENCE: int = int(os.getenv("TRAIN_LR_PLATEAU_PATIENCE", "0"))  # >0 — ReduceLROnPlateau
+TRAIN_LR_PLATEAU_FACTOR: float = float(os.getenv("TRAIN_LR_PLATEAU_FACTOR", "0.5"))
+TRAIN_BUCKET_WIDTH: int = int(os.getenv("TRAIN_BUCKET_WIDTH", "32"))  # те саме для міні-батчів корпусу
+TRAIN_WORKERS: int = int(os.getenv("TRAIN_WORKERS", "1"))  # >1 — навчання по корпусу в N процесах (DDP, gloo)
+TRAIN_WORKER_THREADS: int = int(os.getenv("TRAIN_WORKER_THREADS", "0"))  # потоків torch на процес; 0 — ядра порівну
+TRAIN_CHECKPOINT_EVERY: int = int(os.getenv("TRAIN_CHECKPOINT_EVERY", "100"))  # епох між збереженнями найкращих ваг; 0 — ні
+NAR_ITERATIONS: int = int(os.getenv("NAR_ITERATIONS", "4"))  # проходів Mask-Predict за замовчуванням
+PROFILE_REQUESTS: bool = os.getenv("PROFILE_REQUESTS", "0") == "1"  # дозволити заголовок X-Profile: 1
+PROFILE_INTERVAL_MS: float = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+DATASET_MAX_BYTES: int = int(os.getenv("DATASET_MAX_BYTES", str(512 << 20)))  # ліміт бінарного корпусу; 0 — без ліміту
+DATASET_MAX_AGE_DAYS: float = float(os.getenv("DATASET_MAX_AGE_DAYS", "0"))   # 0 — семпли не старіють
+UPLOADS_MAX_BYTES: int = int(os.getenv("UPLOADS_MAX_BYTES", str(1 << 30)))   # оригінали завантажень
+UPLOADS_MAX_AGE_DAYS: float = float(os.getenv("UPLOADS_MAX_AGE_DAYS", "30"))  # і CSV-логи з DATASETS_DIR
+RETENTION_INTERVAL_S: float = float(os.getenv("RETENTION_INTERVAL_S", "300"))
+DATASET_CSV_LOG: bool = os.getenv("DATASET_CSV_LOG", "0") == "1"  # дублювати семпли в {ts}__X.csv (фоном)
+WARMUP_DECODE: bool = os.getenv("WARMUP_DECODE", "1") == "1"  # прогін декодингу до стану ready (і у воркерах)
+WARMUP_INPUT_LEN: int = int(os.getenv("WARMUP_INPUT_LEN", "0"))  # 0 — довжина входу моделі
+
+# ──────────────────────────── Метрики ─────────────────────────────
+_metrics = MetricsRegistry(prefix="aiarch_")
+_http_seconds = _metrics.histogram(
+    "http_request_duration_seconds", "Тривалість HTTP-запиту до початку відповіді", ("method", "route")
+)
+_http_requests = _metrics.counter("http_requests_total", "Кількість HTTP-запитів", ("method", "route", "status"))
+_stage_seconds = _metrics.histogram(
+    "stage_duration_seconds",
+    "Тривалість етапів: tensor, encode, decode_loop, nar_decode, pool_roundtrip, spool_upload, parse, log, "
+    "retention, train, save_checkpoint",
+    ("stage",),
+)
+_predict_batch_size = _metrics.histogram(
+    "predict_batch_size", "Кількість семплів в одному батчевому декодингу", buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+_decode_tokens = _metrics.counter("decode_tokens_total", "Згенеровано токенів декодером")
+_decode_tokens_per_s = _metrics.gauge("decode_tokens_per_second", "Швидкість декодингу останнього батчу, токенів/с")
+# _jobs створюється нижче — гейдж читає його лише в момент render()
+_metrics.gauge("train_queue_depth", "Задачі навчання, що чекають у черзі", fn=lambda: _jobs.queue_depth())
+
 # ──────────────────────── Модель та сховище ───────────────────────
-_model: Optional[SimpleTransformer] = None  # ліниве створення (CPU)
+configure_threads(INFERENCE_THREADS, INFERENCE_INTEROP_THREADS)
+_registry = ModelRegistry(                  # знімок моделі для передбачень (ліниве створення, CPU)
+    build_inference=lambda m: build_inference_model(m, INFERENCE_MODE)
+)
+_ckpts = CheckpointStore(CHECKPOINT_DIR, keep_last=CHECKPOINT_KEEP, keep_best=CHECKPOINT_KEEP_BEST)
+_trainer: Optional[Trainer] = None          # тренувальна копія моделі + стан Adam (лише потік навчання)
+_trainer_base_version: int = 0              # версія знімка, від якої походить тренувальна копія
+_store: Optional[DatasetStore] = None
+_store_lock = threading.Lock()
 
 
-def get_model(input_len: int, target_len: int) -> SimpleTransformer:
+def _save_checkpoint(model: SimpleTransformer, **kwargs) -> int:
+    """CheckpointStore.save з заміром етапу save_checkpoint."""
+    with _stage_seconds.time(stage="save_checkpoint"):
+        return _ckpts.save(model, **kwargs)
+
+
+def get_snapshot(input_len: int = 441, target_len: int = 441) -> ModelSnapshot:
     """
-    Створює або вантажить модель.
-    Якщо є збережений state_dict — підвантажує.
-    Якщо ні — ініціалізує нову під задані довжини.
+    Поточний незмінний знімок моделі.
+    Якщо знімка ще нема — вантажить останній чекпойнт (битий → попередня версія),
+    мігрує старий saved_model.pth або ініціалізує нову модель під задані довжини.
+    Форма моделі (input/target_seq_len тощо) відновлюється з hparams чекпойнта. Енкодер не
+    прив'язаний до input_len: X будь-якої довжини обробляються як є (без доповнення до 441),
+    тож input_len враховується лише при створенні нової моделі.
     """
-    global _model
-    if _model is not None:
-        return _model
+    def create() -> SimpleTransformer:
+        loaded = _ckpts.load()
+        if loaded is not None:
+            return loaded[0]
+        legacy = load_model(MODEL_PATH)
+        if legacy is not None:
+            _save_checkpoint(legacy, extra={"migrated_from": MODEL_PATH.name})
+            return legacy
+        # Ініціалізувати нову (типові довжини: X≈441, Y≈441)
+        return SimpleTransformer(input_seq_len=input_len, target_seq_len=target_len)
+
+    return _registry.get_or_create(create)
+
+
+def get_model(input_len: int, target_len: int) -> SimpleTransformer:
+    """Модель поточного знімка (лише для читання — не тренувати на ній)."""
+    return get_snapshot(input_len, target_len).model
+
 
-    loaded = load_model(MODEL_PATH)
-    if loaded is not None:
-        _model = loaded
-        return _model
+def get_dataset_store() -> DatasetStore:
+    """Сховище всіх накопичених X/Y; при першому створенні імпортує старі CSV-логи з DATASETS_DIR."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            store = DatasetStore(STORE_DIR)
+            if len(store) == 0:
+                store.import_csv_logs(DATASETS_DIR)
+            _store = store
+    return _store
 
-    # Ініціалізувати нову (типові довжини: X≈441, Y≈441)
-    _model = SimpleTransformer(input_seq_len=input_len, target_seq_len=target_len)
-    return _model
+
+_dataset_logger = DatasetLogger(                  # запис семплів і retention — у фоновому потоці
+    get_dataset_store,
+    uploads_dir=UPLOADS_DIR,
+    csv_dir=DATASETS_DIR,
+    write_csv=DATASET_CSV_LOG,
+    store_max_bytes=DATASET_MAX_BYTES,
+    store_max_age_days=DATASET_MAX_AGE_DAYS,
+    uploads_max_bytes=UPLOADS_MAX_BYTES,
+    uploads_max_age_days=UPLOADS_MAX_AGE_DAYS,
+    retention_interval_s=RETENTION_INTERVAL_S,
+    stage_timer=lambda stage: _stage_seconds.time(stage=stage),
+)
 
 
 # ──────────────────────────── DTO-моделі ──────────────────────────
@@ -74,10 +201,87 @@ class TrainJSON(BaseModel):
     )
     epochs: int = Field(100, ge=1, le=5000)
     lr: float = Field(0.001, gt=0.0, le=0.1)
+    patience: int = Field(0, ge=0, le=5000, description="Епох без покращення до зупинки (0 — без ранньої зупинки)")
+    min_delta: float = Field(0.0, ge=0.0, description="Мінімальне зменшення loss, що вважається покращенням")
+
+
+class TrainDatasetJSON(BaseModel):
+    epochs: int = Field(20, ge=1, le=1000)
+    lr: float = Field(0.001, gt=0.0, le=0.1)
+    batch_size: int = Field(32, ge=1, le=1024)
+    patience: int = Field(0, ge=0, le=1000, description="Епох без покращення val loss до зупинки (0 — без ранньої зупинки)")
+    min_delta: float = Field(0.0, ge=0.0)
+    val_fraction: float = Field(0.1, ge=0.0, le=0.5, description="Частка розмічених семплів для валідації")
+
+
+class RollbackJSON(BaseModel):
+    version: int = Field(..., ge=1, description="Номер версії чекпойнта")
 
 
 class PredictJSON(BaseModel):
     X_data: List[float] = Field(..., description="Послідовність ознак (вимог) X")
+    decode_mode: Literal["greedy", "nar"] = Field(
+        "greedy", description="greedy — 441 послідовний крок; nar — Mask-Predict за кілька паралельних проходів"
+    )
+    iterations: Optional[int] = Field(None, ge=1, le=32, description="Проходів Mask-Predict (nar)")
+
+
+class TrainNARJSON(BaseModel):
+    epochs: int = Field(30, ge=1, le=1000)
+    lr: float = Field(0.001, gt=0.0, le=0.1)
+    batch_size: int = Field(32, ge=1, le=1024)
+
+
+class PredictBatchJSON(BaseModel):
+    X_batch: List[List[float]] = Field(..., description="Багато векторів X — по одному на семпл")
+    format: Literal["ndjson", "csv"] = Field("ndjson", description="Формат потокової відповіді")
+
+
+# ─────────────────── Метрики запитів і профілювання ─────────────────
+_profile_lock = threading.Lock()  # профайлер бачить усі потоки — одночасно лише один запит
+
+
+def _route_label(request: Request) -> str:
+    """Шаблон маршруту (/api/jobs/{job_id}), а не сирий шлях — щоб не плодити мітки."""
+    route = request.scope.get("route")
+    if route is not None:
+        return route.path
+    for r in app.routes:
+        if r.matches(request.scope)[0] == Match.FULL:
+            return r.path
+    return "unmatched"
+
+
+@app.middleware("http")
+async def observe_request(request: Request, call_next):
+    """
+    Гістограма тривалості для кожного ендпоїнта (для стрімінгу — до початку відповіді).
+    PROFILE_REQUESTS=1 + заголовок 'X-Profile: 1' — запит виконується під семплювальним
+    профайлером; ім'я файлу зі стеками повертається в заголовку X-Profile-File.
+    """
+    profiler = None
+    if PROFILE_REQUESTS and request.headers.get("x-profile") == "1" and _profile_lock.acquire(blocking=False):
+        profiler = SamplingProfiler(interval_s=PROFILE_INTERVAL_MS / 1000.0)
+        profiler.start()
+
+    t0 = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        route = _route_label(request)
+        _http_seconds.observe(time.perf_counter() - t0, method=request.method, route=route)
+        _http_requests.inc(method=request.method, route=route, status=status)
+        if profiler is not None:
+            profiler.stop()
+            _profile_lock.release()
+
+    if profiler is not None:
+        name = f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}__{route.strip('/').replace('/', '_') or 'root'}.txt"
+        await run_in_threadpool(profiler.dump, PROFILES_DIR / name)
+        response.headers["X-Profile-File"] = name
+    return response
 
 
 # ───────────────────────────── Ендпоїнти ──────────────────────────
@@ -86,76 +290,649 @@ def ping():
     return {"status": "ok", "message": "AI Architecture API is alive"}
 
 
+@app.get("/api/health/live")
+def health_live():
+    """Liveness: процес відповідає (модель може ще вантажитись)."""
+    return {"status": "alive", "uptime_s": time.time() - _startup["started_at"]}
+
+
+@app.get("/api/health/ready")
+def health_ready():
+    """Readiness: 200 — модель завантажена і прогріта, 503 — ще стартує або старт упав."""
+    body = {**_startup, "model_version": _registry.version}
+    return JSONResponse(body, status_code=200 if _startup["status"] == "ready" else 503)
+
+
+def _fit_tokens(tokens: torch.Tensor, length: int = 441) -> torch.Tensor:
+    """Підрізати/доповнити нулями (B, Lt) → (B, length)"""
+    lt = tokens.shape[1]
+    if lt < length:
+        pad = torch.zeros((tokens.shape[0], length - lt), dtype=torch.long)
+        tokens = torch.cat([tokens, pad], dim=1)
+    elif lt > length:
+        tokens = tokens[:, :length]
+    return tokens
+
+
+def _predict_batch(x: torch.Tensor, mask: Optional[torch.Tensor] = None) -> torch.Tensor:
+    """
+    Батчевий greedy-декодинг для мікро-батчера (оптимізована збірка поточного знімка).
+    x: (B, Lx) → (B, 441) токенів; mask — доповнені позиції, якщо X у батчі різної довжини
+    """
+    # Довжину таргету беремо з поточної моделі або типову 441 (21*21)
+    model = get_snapshot(input_len=x.shape[1], target_len=441).infer_model
+    timings = {}
+    tokens = predict_tokens_greedy_batch(
+        model, x, max_len=model.target_seq_len, start_token=START_TOKEN, timings=timings,
+        src_key_padding_mask=mask,
+    )  # (B, Lt)
+    _stage_seconds.observe(timings["encode"], stage="encode")
+    _stage_seconds.observe(timings["decode"], stage="decode_loop")
+    _observe_decode(tokens.numel(), timings["decode"], x.shape[0])
+    return _fit_tokens(tokens)
+
+
+def _observe_decode(n_tokens: int, seconds: float, batch_size: int):
+    _predict_batch_size.observe(batch_size)
+    _decode_tokens.inc(n_tokens)
+    if seconds > 0:
+        _decode_tokens_per_s.set(n_tokens / seconds)
+
+
+_pool: Optional[InferenceWorkerPool] = (
+    InferenceWorkerPool(
+        INFERENCE_WORKERS,
+        str(CHECKPOINT_DIR),
+        inference_mode=INFERENCE_MODE,
+        threads_per_worker=INFERENCE_WORKER_THREADS,
+        warmup=WARMUP_DECODE,
+    )
+    if INFERENCE_WORKERS > 0
+    else None
+)
+
+
+def _predict_batch_pool(x: torch.Tensor, mask: Optional[torch.Tensor] = None) -> torch.Tensor:
+    """Те саме, що _predict_batch, але декодинг — у вільному процесі пулу інференсу."""
+    t0 = time.perf_counter()
+    tokens = _pool.run_batch(x, mask)
+    elapsed = time.perf_counter() - t0
+    _stage_seconds.observe(elapsed, stage="pool_roundtrip")
+    _observe_decode(tokens.numel(), elapsed, x.shape[0])
+    return _fit_tokens(tokens)
+
+
+_batcher = MicroBatcher(
+    _predict_batch_pool if _pool is not None else _predict_batch,
+    max_batch=PREDICT_MAX_BATCH,
+    window_ms=PREDICT_BATCH_WINDOW_MS,
+    workers=INFERENCE_WORKERS if _pool is not None else 1,
+    bucket_width=PREDICT_BUCKET_WIDTH,
+)
+_pred_cache = PredictionCache(max_entries=PREDICT_CACHE_SIZE, ttl_s=PREDICT_CACHE_TTL_S)
+_registry.on_publish(lambda snap: _pred_cache.clear())  # нова версія моделі — старі передбачення не потрібні
+if _pool is not None:
+    # До заміни знімка (чекпойнт уже збережено в publish(persist=...)): запит, що взяв нову версію
+    # для ключа кешу, вже застане нове покоління пулу — інакше старий воркер відповів би старою
+    # моделлю, і відповідь лягла б у кеш під ключем нової версії на PREDICT_CACHE_TTL_S.
+    _registry.on_publish(lambda snap: _pool.reload(), before_swap=True)
+
+_metrics.gauge("predict_queue_depth", "Запити, що чекають у мікро-батчері", fn=_batcher.queue_depth)
+_metrics.gauge("model_version", "Версія знімка моделі, що обслуговує передбачення", fn=lambda: _registry.version)
+_metrics.gauge("checkpoint_latest_version", "Остання версія чекпойнта на диску", fn=_ckpts.latest_version)
+_metrics.gauge("prediction_cache_hit_rate", "Частка влучань у кеш передбачень", fn=lambda: _pred_cache.stats()["hit_rate"])
+_metrics.gauge(
+    "positional_cache_bytes", "Спільні позиційні таблиці й каузальні маски в пам'яті процесу",
+    fn=lambda: positional_cache_stats()["bytes"],
+)
+_metrics.gauge("prediction_cache_entries", "Записів у кеші передбачень", fn=lambda: _pred_cache.stats()["entries"])
+
+
+# ─────────────────────────── Старт і готовність ───────────────────────────
+# Процес починає приймати з'єднання одразу (/api/ping, /api/health/live), а модель вантажиться
+# у фоновому потоці: чекпойнт → пул воркерів (якщо є) → warm-up декодинг → ready.
+# /api/health/ready віддає 503, доки послідовність не завершилась — балансувальник не шле
+# трафік на репліку, що ще вантажиться. Запити, що все ж прийшли раніше, просто чекають модель.
+_startup = {"status": "starting", "error": None, "started_at": time.time(), "ready_at": None, "stages_s": {}}
+
+
+def _startup_sequence():
+    stages = _startup["stages_s"]
+    try:
+        t0 = time.perf_counter()
+        snap = get_snapshot()
+        stages["load_model"] = time.perf_counter() - t0
+        if _pool is not None:
+            # воркери вантажать модель з чекпойнта — тож він має існувати до їхнього старту
+            t0 = time.perf_counter()
+            if _ckpts.latest_version() is None:
+                _save_checkpoint(snap.model, extra={"kind": "init"})
+            _pool.start()  # з warmup=True кожен воркер прогріває декодинг до "ready"
+            stages["start_workers"] = time.perf_counter() - t0
+        elif WARMUP_DECODE:
+            stages["warmup"] = warm_up(snap.infer_model, WARMUP_INPUT_LEN)
+        _startup["status"] = "ready"
+        _startup["ready_at"] = time.time()
+    except Exception as e:
+        _startup["status"] = "failed"
+        _startup["error"] = f"{type(e).__name__}: {e}"
+        return
+
+    # не впливає на готовність: pandas/openpyxl для завантажень і сховище корпусу (імпорт старих CSV)
+    try:
+        import model.ingest  # noqa: F401
+
+        get_dataset_store()
+    except Exception:
+        pass
+
+
+@app.on_event("startup")
+def start_background_init():
+    threading.Thread(target=_startup_sequence, name="startup", daemon=True).start()
+
+
+_metrics.gauge("ready", "1 — модель завантажена і прогріта", fn=lambda: float(_startup["status"] == "ready"))
+
+
+@app.on_event("shutdown")
+def stop_inference_pool():
+    if _pool is not None:
+        _pool.stop()
+
+
+@app.on_event("startup")
+def start_dataset_logger():
+    _dataset_logger.start()
+
+
+@app.on_event("shutdown")
+def stop_dataset_logger():
+    """Дописати чергу семплів у сховище перед виходом."""
+    _dataset_logger.stop()
+
+
+_metrics.gauge("dataset_log_queue_depth", "Семпли, що чекають запису в сховище", fn=_dataset_logger.queue_depth)
+_metrics.gauge("dataset_store_bytes", "Розмір бінарного корпусу X/Y", fn=lambda: _store.nbytes() if _store is not None else None)
+
+
+def _submit_predict(x: torch.Tensor) -> Future:
+    """
+    Передбачення для одного X: спершу кеш (версія моделі + X), інакше — мікро-батчер.
+    Результат декодингу кладеться в кеш під версією, актуальною на момент запиту.
+    """
+    key = PredictionCache.make_key(_registry.version, x)
+    cached = _pred_cache.get(key)
+    if cached is not None:
+        fut: Future = Future()
+        fut.set_result(cached)
+        return fut
+
+    def remember(f: Future):
+        if not f.cancelled() and f.exception() is None:
+            _pred_cache.put(key, f.result())
+
+    fut = _batcher.submit(x)
+    fut.add_done_callback(remember)
+    return fut
+
+
 @app.post("/api/predict")
-def predict_endpoint(body: PredictJSON):
+async def predict_endpoint(body: PredictJSON):
     """
-    Приймає X_data і повертає передбачену матрицю 21x21 (список списків)
+    Приймає X_data і повертає передбачену матрицю 21x21 (список списків).
+    Конкурентні запити об'єднуються мікро-батчером в один батчевий декодинг.
     """
-    x = torch.tensor(body.X_data, dtype=torch.float32).unsqueeze(0)  # (1, Lx)
+    with _stage_seconds.time(stage="tensor"):
+        x = torch.tensor(body.X_data, dtype=torch.float32)  # (Lx,)
+    if body.decode_mode == "nar":
+        nar = get_nar_head()
+        if nar is None:
+            return {"status": "error", "message": "Голову Mask-Predict ще не навчено (/api/jobs/train/nar)."}
+        tokens = await run_in_threadpool(_predict_nar, nar[0], x, body.iterations or NAR_ITERATIONS)
+        return {"predicted": tokens.view(21, 21).tolist(), "decode_mode": "nar"}
+    tokens = await asyncio.wrap_future(_submit_predict(x))  # (441,)
+    return {"predicted": tokens.view(21, 21).tolist()}
 
-    # Довжину таргету беремо з поточної моделі або типову 441 (21*21)
-    model = get_model(input_len=x.shape[1], target_len=441)
-    model.eval()
 
-    with torch.no_grad():
-        tokens = predict_tokens_greedy(
-            model, x, max_len=model.target_seq_len, start_token=START_TOKEN
-        )  # (Lt,)
+def _wire_error(e: Exception) -> JSONResponse:
+    return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
 
-        # Підрізати/доповнити до 441 токенів
-        lt = tokens.shape[0]
-        if lt < 441:
-            pad = torch.zeros(441 - lt, dtype=torch.long)
-            tokens = torch.cat([tokens, pad], dim=0)
-        elif lt > 441:
-            tokens = tokens[:441]
 
-        matrix = tokens.view(21, 21).tolist()
-        return {"predicted": matrix}
+@app.post("/api/predict/binary")
+async def predict_binary_endpoint(
+    request: Request,
+    decode_mode: Literal["greedy", "nar"] = Query("greedy"),
+    iterations: Optional[int] = Query(None, ge=1, le=32),
+):
+    """
+    Те саме, що /api/predict, у бінарному форматі (model/wire.py):
+    тіло — X як little-endian float32, відповідь — 441 байт uint8 (матриця 21x21 по рядках).
+    """
+    body = await request.body()
+    try:
+        with _stage_seconds.time(stage="tensor"):
+            x = decode_x(body)  # (Lx,) — view на тіло запиту
+    except WireFormatError as e:
+        return _wire_error(e)
+    if decode_mode == "nar":
+        nar = get_nar_head()
+        if nar is None:
+            return _wire_error(ValueError("Голову Mask-Predict ще не навчено (/api/jobs/train/nar)."))
+        tokens = await run_in_threadpool(_predict_nar, nar[0], x, iterations or NAR_ITERATIONS)
+    else:
+        tokens = await asyncio.wrap_future(_submit_predict(x))  # (441,)
+    return Response(
+        encode_tokens(tokens.view(21, 21)),
+        media_type=WIRE_CONTENT_TYPE,
+        headers={"X-Shape": "21,21", "X-Decode-Mode": decode_mode},
+    )
 
 
-@app.post("/api/train")
-def train_endpoint(body: TrainJSON):
+# ───────────────── Неавторегресивний декодинг (Mask-Predict) ─────────────────
+_nar_head = None                 # (MaskPredictHead, meta) або None; ліниво з NAR_HEAD_PATH
+_nar_loaded = False
+_nar_lock = threading.Lock()
+
+
+def get_nar_head():
+    """Навчена голова Mask-Predict і її метадані (base_version, loss, epochs) або None."""
+    global _nar_head, _nar_loaded
+    with _nar_lock:
+        if not _nar_loaded:
+            _nar_head = load_head(NAR_HEAD_PATH)
+            _nar_loaded = True
+        return _nar_head
+
+
+def _predict_nar(head: MaskPredictHead, x: torch.Tensor, iterations: int) -> torch.Tensor:
     """
-    Донавчання:
-      - якщо Y_data подано: тренуємо на (X, Y)
-      - якщо Y_data немає: псевдоціль (нули) — лише для адаптації ембеддингів, краще надавати реальний Y
+    Один X → (441,) токенів за iterations паралельних проходів поверх енкодера поточного знімка.
+    Енкодер — fp32 (snap.model), а не збірка INFERENCE_MODE: голову навчено саме на ньому,
+    а int8-енкодер дає інші memory, на яких голова не навчалась.
     """
-    x = torch.tensor(body.X_data, dtype=torch.float32).unsqueeze(0)  # (1, Lx)
-    model = get_model(input_len=x.shape[1], target_len=441)
+    model = get_snapshot().model
+    with _stage_seconds.time(stage="nar_decode"):
+        tokens = predict_batch_nar(model, head, [x], iterations=iterations)
+    return _fit_tokens(tokens)[0]
 
-    if body.Y_data is not None:
-        y = torch.tensor(body.Y_data, dtype=torch.long)
+
+def _run_nar_job(job: TrainingJob) -> dict:
+    """
+    Навчання голови Mask-Predict по розміченому корпусу на замороженому енкодері поточного знімка.
+    Модель для greedy-передбачень не змінюється. Якщо голова вже є і форма збігається — донавчається.
+    """
+    global _nar_head
+    snap = get_snapshot()
+    existing = get_nar_head()
+    head = MaskPredictHead.for_model(snap.model)
+    if existing is not None and existing[0].hparams() == head.hparams():
+        head.load_state_dict(existing[0].state_dict())
+
+    trainer = MaskPredictTrainer(head, lr=job.params["lr"])
+    with _stage_seconds.time(stage="train"):
+        trainer.fit_dataset(
+            snap.model,
+            get_dataset_store(),
+            epochs=job.epochs_total,
+            batch_size=job.params["batch_size"],
+            on_epoch=job.report,
+            bucket_width=TRAIN_BUCKET_WIDTH,
+        )
+    head.eval()
+    meta = {"base_version": snap.version, "loss": job.last_loss, "epochs": job.epochs_done, "job_id": job.id}
+    save_head(head, NAR_HEAD_PATH, meta)
+    with _nar_lock:
+        _nar_head = load_head(NAR_HEAD_PATH) or (head, meta)
+    return {"epochs": job.epochs_done, "last_loss": job.last_loss, "avg_loss": job.avg_loss, "base_version": snap.version}
+
+
+def _prepare_xy(X_list: List[float], Y_tokens: Optional[List[int]]):
+    """
+    X → (1, Lx) float, Y → (1, 441) long.
+    Якщо Y немає — псевдоціль (нулі), лише для адаптації ембеддингів.
+    """
+    x = torch.as_tensor(X_list, dtype=torch.float32).unsqueeze(0)  # (1, Lx)
+    if Y_tokens is not None:
+        y = torch.as_tensor(Y_tokens, dtype=torch.long)
         # Безпечно підрівняти до 441
-        if y.numel() < 441:
-            pad = torch.zeros(441 - y.numel(), dtype=torch.long)
-            y = torch.cat([y, pad], dim=0)
-        elif y.numel() > 441:
-            y = y[:441]
-        y = y.view(1, -1)  # (1, Ly)
+        y = _fit_tokens(y.view(1, -1))  # (1, Ly)
     else:
         y = torch.zeros((1, 441), dtype=torch.long)
+    return x, y
+
+
+def get_trainer(input_len: int) -> Trainer:
+    """
+    Тренер працює з власною копією моделі, тож /api/predict і далі обслуговується
+    останньою зафіксованою моделлю. Стан Adam підтягується з чекпойнта.
+    Викликається лише з потоку навчання.
+    """
+    global _trainer, _trainer_base_version
+    if _trainer is not None:
+        return _trainer
+
+    snap = get_snapshot(input_len=input_len, target_len=441)
+    trainer = Trainer(
+        ModelRegistry.training_copy(snap),
+        lr=0.001,
+        lr_gamma=TRAIN_LR_GAMMA,
+        plateau_patience=TRAIN_LR_PLATEAU_PATIENCE,
+        plateau_factor=TRAIN_LR_PLATEAU_FACTOR,
+    )
+    state = _ckpts.load_trainer_state()
+    if state is not None:
+        try:
+            trainer.load_state_dict(state)
+        except Exception:
+            pass  # несумісний стан (інша архітектура) — почати з чистого Adam
+    _trainer = trainer
+    _trainer_base_version = snap.version
+    return _trainer
+
+
+def _run_train_job(job: TrainingJob) -> dict:
+    """
+    Виконується у потоці-воркері навчання.
+    Після успішного навчання тренувальна копія зберігається разом зі станом оптимізатора,
+    а її знімок атомарно підміняє модель для передбачень.
+    patience > 0 — рання зупинка (модель повертається до найкращої епохи); кожні
+    TRAIN_CHECKPOINT_EVERY епох (якщо було покращення) ваги зберігаються як проміжна версія (kind=best),
+    яка не стає поточною, але доступна для rollback: найкращі при patience > 0, поточні — при 0.
+    """
+    global _trainer, _trainer_base_version
+    if job.kind == "train_nar":
+        return _run_nar_job(job)
+    if job.kind == "train_dataset":
+        store = get_dataset_store()
+        trainer = get_trainer(input_len=441)
+    else:
+        x, y = job.params["x"], job.params["y"]
+        trainer = get_trainer(input_len=x.shape[1])
+
+    trainer.set_lr(job.params["lr"])
+    stopper = EarlyStopping(job.params.get("patience", 0), job.params.get("min_delta", 0.0))
+
+    def save_best(state, metric: float, epoch: int):
+        model = SimpleTransformer(**trainer.model.hparams())
+        model.load_state_dict(state)
+        _save_checkpoint(
+            model,
+            loss=metric,
+            extra={"job_id": job.id, "kind": "best", "epoch": epoch, "lr": job.params["lr"]},
+            make_latest=False,
+        )
+
+    loop = {
+        "on_epoch": job.report,
+        "early_stopping": stopper,
+        "on_checkpoint": save_best,
+        "checkpoint_every": TRAIN_CHECKPOINT_EVERY,
+    }
+    try:
+        # JobCancelled з job.report → виняток
+        with _stage_seconds.time(stage="train"):
+            if job.kind == "train_dataset":
+                dataset_args = {
+                    "epochs": job.epochs_total,
+                    "batch_size": job.params["batch_size"],
+                    "val_fraction": job.params.get("val_fraction", 0.0),
+                    "bucket_width": TRAIN_BUCKET_WIDTH,
+                    **loop,
+                }
+                with store.pinned():  # фоновий retention не перенумеровує семпли посеред навчання
+                    if TRAIN_WORKERS > 1:
+                        fit_dataset_ddp(
+                            trainer, store, world_size=TRAIN_WORKERS, threads_per_worker=TRAIN_WORKER_THREADS,
+                            **dataset_args,
+                        )
+                    else:
+                        trainer.fit_dataset(store, **dataset_args)
+            else:
+                trainer.fit(x, y, epochs=job.epochs_total, **loop)
+    except BaseException:
+        # частково навчена копія відкидається; наступна задача стартує з зафіксованої моделі
+        _trainer = None
+        raise
+
+    snap = _registry.publish(
+        copy.deepcopy(trainer.model),
+        expected_version=_trainer_base_version,
+        persist=lambda m: _save_checkpoint(
+            m,
+            trainer_state=trainer.state_dict(),
+            loss=stopper.best if stopper.should_stop else job.last_loss,
+            extra={"job_id": job.id, "kind": job.kind, "epochs": job.epochs_done, "lr": job.params["lr"]},
+        ),
+    )
+    if snap is None:
+        # модель замінили (reset) під час навчання — результат застарів
+        _trainer = None
+        raise RuntimeError("Модель було скинуто під час навчання — результат відкинуто")
+    _trainer_base_version = snap.version
+    return {
+        "epochs": job.epochs_done,
+        "last_loss": job.last_loss,
+        "avg_loss": job.avg_loss,
+        "val_loss": job.val_loss,
+        "best_loss": stopper.best,
+        "best_epoch": stopper.best_epoch,
+        "stopped_early": stopper.should_stop,
+        "lr": trainer.lr,
+    }
+
+
+_jobs = TrainingJobManager(_run_train_job)
 
-    loss_hist = []
-    for _ in range(body.epochs):
-        loss = train_once(model, x, y, lr=body.lr, vocab_size=VOCAB_SIZE)
-        loss_hist.append(loss)
 
-    save_model(model, MODEL_PATH)
+def _train_params(body: TrainJSON, x: torch.Tensor, y: torch.Tensor) -> dict:
+    return {"x": x, "y": y, "lr": body.lr, "patience": body.patience, "min_delta": body.min_delta}
+
+
+def _train_dataset_params(body: TrainDatasetJSON) -> dict:
     return {
-        "status": "trained",
-        "epochs": body.epochs,
-        "last_loss": loss_hist[-1],
-        "avg_loss": sum(loss_hist) / len(loss_hist),
+        "lr": body.lr,
+        "batch_size": body.batch_size,
+        "patience": body.patience,
+        "min_delta": body.min_delta,
+        "val_fraction": body.val_fraction,
     }
 
 
+def _prepare_upload(upload: SpooledUpload, sheet: Optional[str]):
+    """
+    Парсинг завантаженого файлу (виконується поза event loop).
+    Файл уже на диску (UPLOADS_DIR/{sha256}{ext}) і читається звідти, без копій у пам'яті.
+    Запис семпла в корпус — фоном через _dataset_logger (дубль за sha256 пропускається там же).
+    Повертає (X_list, Y_tokens, log_files) або (None, None, None), якщо X не прочитано.
+    """
+    from model.ingest import extract_xy, read_tabular  # pandas — не на шляху старту сервісу
+
+    # --- парсинг X+Y або тільки X: файл читається один раз (автодетект аркуша X для .xlsx)
+    try:
+        with _stage_seconds.time(stage="parse"):
+            X_list, Y_tokens = extract_xy(read_tabular(upload.path, upload.filename, sheet))
+    except Exception:
+        X_list, Y_tokens = None, None
+    if X_list is None:
+        return None, None, None
+
+    # --- семпл у бінарне сховище корпусу (для навчання міні-батчами) — поза латентністю запиту
+    if not upload.duplicate:
+        _dataset_logger.submit(X_list, Y_tokens, upload.sha256)
+
+    log_files = {
+        "sha256": upload.sha256,
+        "duplicate": upload.duplicate,
+        "original": str(upload.path),
+        "queued": not upload.duplicate,
+    }
+    return X_list, Y_tokens, log_files
+
+
+_JOB_CANCELLED = {"status": "cancelled", "message": "Навчання скасовано, модель не змінено."}
+
+
+async def _await_job(job: TrainingJob, status: str, **extra) -> dict:
+    """
+    Дочекатися задачі й зібрати відповідь синхронного ендпойнта: {"status": status, **result, **extra}.
+    Скасування (/api/jobs/{id}/cancel) → _JOB_CANCELLED; помилка задачі (напр. порожній корпус) —
+    {"status": "error"} з тим самим повідомленням, що й job.error у /api/jobs/{id}, а не 500.
+    """
+    try:
+        result = await asyncio.wrap_future(job.future)
+    except JobCancelled:
+        return _JOB_CANCELLED
+    except Exception as e:
+        return {"status": "error", "message": str(e), "job_id": job.id}
+    return {"status": status, **result, **extra}
+
+
+async def _submit_upload_job(
+    file: UploadFile, sheet: Optional[str], epochs: int, lr: float, patience: int = 0, min_delta: float = 0.0
+):
+    """Спільна частина /api/train/upload та /api/jobs/train/upload. Повертає (job, log_files) або (None, None)."""
+    with _stage_seconds.time(stage="spool_upload"):
+        upload = await spool_upload(file, UPLOADS_DIR)
+    X_list, Y_tokens, log_files = await run_in_threadpool(_prepare_upload, upload, sheet)
+    if X_list is None:
+        return None, None
+
+    x, y = _prepare_xy(X_list, Y_tokens)
+    epochs = max(1, min(5000, epochs))
+    lr = max(1e-6, min(0.1, lr))
+    params = {"x": x, "y": y, "lr": lr, "patience": max(0, min(5000, patience)), "min_delta": max(0.0, min_delta)}
+    job = _jobs.submit("train_upload", params, epochs_total=epochs)
+    return job, log_files
+
+
+_UPLOAD_PARSE_ERROR = {"status": "error", "message": "Не вдалося прочитати X_data з файлу. Перевір формат."}
+
+
+async def _stream_predictions(row_chunks: Iterator[List], fmt: str) -> AsyncIterator[str]:
+    """
+    Подає рядки в мікро-батчер вікном по 2×PREDICT_MAX_BATCH і віддає результати
+    в порядку входу, щойно вони готові: NDJSON ({"index", "predicted"}) або CSV (index,c0..c440).
+    row_chunks — ітератор списків X; наступний чанк читається поза event loop (потоковий CSV).
+    """
+    if fmt == "csv":
+        yield "index," + ",".join(f"c{i}" for i in range(441)) + "\n"
+
+    window = max(1, PREDICT_MAX_BATCH) * 2
+    pending = deque()
+
+    async def emit(i: int, fut) -> str:
+        try:
+            tokens = await asyncio.wrap_future(fut)  # (441,)
+        except Exception as e:
+            if fmt == "csv":
+                return f"{i}" + "," * 441 + "\n"  # порожні клітинки — помилка декодування
+            return json.dumps({"index": i, "error": str(e)}) + "\n"
+        if fmt == "csv":
+            return f"{i}," + ",".join(str(t) for t in tokens.tolist()) + "\n"
+        return json.dumps({"index": i, "predicted": tokens.view(21, 21).tolist()}) + "\n"
+
+    index = 0
+    while True:
+        chunk = await run_in_threadpool(next, row_chunks, None)
+        if chunk is None:
+            break
+        for row in chunk:
+            pending.append((index, _submit_predict(torch.as_tensor(row, dtype=torch.float32))))
+            index += 1
+            if len(pending) >= window:
+                yield await emit(*pending.popleft())
+    while pending:
+        yield await emit(*pending.popleft())
+
+
+def _stream_response(row_chunks: Iterator[List], fmt: str, background: Optional[BackgroundTask] = None) -> StreamingResponse:
+    media_type = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    return StreamingResponse(_stream_predictions(row_chunks, fmt), media_type=media_type, background=background)
+
+
+@app.post("/api/predict/batch")
+async def predict_batch_endpoint(body: PredictBatchJSON):
+    """
+    Пакетне передбачення: багато X за один запит.
+    Результати (21x21 на семпл) стрімляться по мірі готовності батчів.
+    """
+    return _stream_response(iter([body.X_batch]), body.format)
+
+
+@app.post("/api/predict/batch/upload")
+async def predict_batch_from_file(
+    file: UploadFile = File(...),
+    sheet: Optional[str] = Form(None),
+    format: Literal["ndjson", "csv"] = Form("ndjson"),
+):
+    """
+    Пакетне передбачення з CSV/Excel: один рядок — один семпл
+    (числові стовпці або стовпець 'X' з комами). Відповідь — NDJSON або CSV потоком.
+    """
+    from model.ingest import iter_x_row_chunks_csv, read_tabular, x_rows_from_frame
+
+    # файл пишеться на диск чанками і читається звідти; після відповіді — видаляється
+    upload = await spool_upload(file, UPLOADS_DIR / "tmp", keep=False)
+    cleanup = BackgroundTask(os.remove, upload.path)
+    if not (upload.filename or "").lower().endswith(".xlsx"):
+        # CSV читається чанками під час стрімінгу відповіді
+        return _stream_response(iter_x_row_chunks_csv(upload.path), format, background=cleanup)
+
+    try:
+        src = await run_in_threadpool(read_tabular, upload.path, upload.filename, sheet)
+        rows = x_rows_from_frame(src.x_frame)
+    except Exception:
+        rows = None
+    if not rows:
+        await run_in_threadpool(os.remove, upload.path)
+        return {"status": "error", "message": "Не вдалося прочитати X з файлу. Перевір формат."}
+    return _stream_response(iter([rows]), format, background=cleanup)
+
+
+@app.post("/api/train")
+async def train_endpoint(body: TrainJSON):
+    """
+    Донавчання:
+      - якщо Y_data подано: тренуємо на (X, Y)
+      - якщо Y_data немає: псевдоціль (нули) — лише для адаптації ембеддингів, краще надавати реальний Y
+    Виконується як фонова задача; запит чекає на її завершення, не блокуючи event loop.
+    """
+    x, y = _prepare_xy(body.X_data, body.Y_data)
+    job = _jobs.submit("train", _train_params(body, x, y), epochs_total=body.epochs)
+    return await _await_job(job, "trained")
+
+
+@app.post("/api/train/binary")
+async def train_binary_endpoint(
+    request: Request,
+    x_len: Optional[int] = Query(None, ge=1, description="Кількість float32 X; решта тіла — Y (uint8). Без x_len — лише X"),
+    epochs: int = Query(100, ge=1, le=5000),
+    lr: float = Query(0.001, gt=0.0, le=0.1),
+    patience: int = Query(0, ge=0, le=5000),
+    min_delta: float = Query(0.0, ge=0.0),
+):
+    """/api/train у бінарному форматі: тіло — X (float32) і одразу за ним Y (uint8), параметри — у query."""
+    body = await request.body()
+    try:
+        with _stage_seconds.time(stage="tensor"):
+            x_raw, y_raw = decode_xy(body, x_len, VOCAB_SIZE)
+    except WireFormatError as e:
+        return _wire_error(e)
+    x, y = _prepare_xy(x_raw, y_raw)
+    params = {"x": x, "y": y, "lr": lr, "patience": patience, "min_delta": min_delta}
+    job = _jobs.submit("train", params, epochs_total=epochs)
+    return await _await_job(job, "trained")
+
+
 @app.post("/api/train/upload")
 async def train_from_file(
     file: UploadFile = File(...),
     sheet: Optional[str] = Form(None),
     epochs: int = Form(150),
     lr: float = Form(0.001),
+    patience: int = Form(0),
+    min_delta: float = Form(0.0),
 ):
     """
     Завантаження CSV/Excel:
@@ -163,70 +940,118 @@ async def train_from_file(
       ВАРІАНТ B (X+Y): файл містить X і Y → повноцінне навчання на (X, Y)
     Підтримка: .csv, .xlsx. Для Excel можна вказати назву аркуша через sheet; якщо не вказано — автодетект.
     """
-    import pandas as pd  # локальний імпорт, щоб уникати важкого імпорту зайвий раз
+    job, log_files = await _submit_upload_job(file, sheet, epochs, lr, patience, min_delta)
+    if job is None:
+        return _UPLOAD_PARSE_ERROR
 
-    content = await file.read()
-    buf = io.BytesIO(content)
+    return await _await_job(job, "trained_from_file", log_files=log_files)
 
-    # --- LOG: зберегти оригінал файлу
-    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-    base_name = Path(file.filename or f"dataset_{ts}").stem
-    ext = Path(file.filename or "").suffix or ".bin"
-    orig_path = DATASETS_DIR / f"{ts}__{base_name}{ext}"
-    with open(orig_path, "wb") as f:
-        f.write(content)
 
-    # --- парсинг X+Y або тільки X (utils має автодетект аркуша X для .xlsx)
-    X_list, Y_tokens = parse_XY_from_tabular(buf, filename=file.filename, sheet_name=sheet)
+@app.post("/api/train/dataset")
+async def train_on_dataset(body: TrainDatasetJSON):
+    """
+    Навчання міні-батчами по всіх накопичених завантаженнях (сховище data/store).
+    Кожна епоха — перемішаний прохід по train-частині корпусу з розміченими Y;
+    val_fraction семплів відкладається для val loss (рання зупинка, ReduceLROnPlateau).
+    """
+    job = _jobs.submit("train_dataset", _train_dataset_params(body), epochs_total=body.epochs)
+    return await _await_job(job, "trained_on_dataset")
 
-    if X_list is None:
-        # fallback: спробувати тільки X
-        buf.seek(0)
-        X_list = parse_X_from_tabular(buf, filename=file.filename, sheet_name=sheet)
-        if X_list is None:
-            return {"status": "error", "message": "Не вдалося прочитати X_data з файлу. Перевір формат."}
 
-    # --- LOG: нормалізовані X/Y окремо
-    try:
-        pd.DataFrame([X_list]).to_csv(DATASETS_DIR / f"{ts}__X.csv", index=False)
-        if Y_tokens is not None:
-            pd.DataFrame([Y_tokens]).to_csv(DATASETS_DIR / f"{ts}__Y_0_440.csv", index=False)
-    except Exception:
-        pass
+_NO_LABELED_SAMPLES = {"status": "error", "message": "У сховищі датасетів немає семплів з Y — голову Mask-Predict нема на чому вчити."}
 
-    x = torch.tensor(X_list, dtype=torch.float32).unsqueeze(0)
-    model = get_model(input_len=x.shape[1], target_len=441)
 
-    if Y_tokens is not None:
-        y = torch.tensor(Y_tokens, dtype=torch.long)
-        if y.numel() < 441:
-            pad = torch.zeros(441 - y.numel(), dtype=torch.long)
-            y = torch.cat([y, pad], dim=0)
-        elif y.numel() > 441:
-            y = y[:441]
-        y = y.view(1, -1)
-    else:
-        y = torch.zeros((1, 441), dtype=torch.long)
+def _has_labeled_samples() -> bool:
+    return get_dataset_store().stats()["labeled"] > 0
 
-    loss_hist = []
-    epochs = max(1, min(5000, epochs))
-    lr = max(1e-6, min(0.1, lr))
-    for _ in range(epochs):
-        loss = train_once(model, x, y, lr=lr, vocab_size=VOCAB_SIZE)
-        loss_hist.append(loss)
 
-    save_model(model, MODEL_PATH)
-    return {
-        "status": "trained_from_file",
-        "epochs": epochs,
-        "last_loss": loss_hist[-1],
-        "avg_loss": sum(loss_hist) / len(loss_hist),
-        "log_files": {
-            "original": str(orig_path),
-            "X_csv": str(DATASETS_DIR / f"{ts}__X.csv"),
-            "Y_csv": (str(DATASETS_DIR / f"{ts}__Y_0_440.csv") if Y_tokens is not None else None),
-        },
-    }
+@app.post("/api/train/nar")
+async def train_nar(body: TrainNARJSON):
+    """Навчити голову Mask-Predict (decode_mode=nar) по накопиченому корпусу; greedy-модель не змінюється."""
+    if not _has_labeled_samples():
+        return _NO_LABELED_SAMPLES
+    job = _jobs.submit("train_nar", {"lr": body.lr, "batch_size": body.batch_size}, epochs_total=body.epochs)
+    return await _await_job(job, "trained_nar")
+
+
+@app.get("/api/datasets")
+def datasets_info():
+    """Кількість семплів, розмічених семплів, довжини X, розмір сховища і стан фонового логера."""
+    return {**get_dataset_store().stats(), "logger": _dataset_logger.stats()}
+
+
+# ───────────────────── Фонові задачі навчання ─────────────────────
+@app.post("/api/jobs/train")
+def submit_train_job(body: TrainJSON):
+    """Поставити навчання на (X, Y) у чергу; повертає job_id для опитування прогресу."""
+    x, y = _prepare_xy(body.X_data, body.Y_data)
+    job = _jobs.submit("train", _train_params(body, x, y), epochs_total=body.epochs)
+    return job.to_dict()
+
+
+@app.post("/api/jobs/train/dataset")
+def submit_train_dataset_job(body: TrainDatasetJSON):
+    """Поставити навчання по всьому корпусу в чергу; повертає job_id."""
+    job = _jobs.submit("train_dataset", _train_dataset_params(body), epochs_total=body.epochs)
+    return job.to_dict()
+
+
+@app.post("/api/jobs/train/nar")
+def submit_train_nar_job(body: TrainNARJSON):
+    """Поставити навчання голови Mask-Predict у чергу; повертає job_id."""
+    if not _has_labeled_samples():
+        return _NO_LABELED_SAMPLES
+    job = _jobs.submit("train_nar", {"lr": body.lr, "batch_size": body.batch_size}, epochs_total=body.epochs)
+    return job.to_dict()
+
+
+@app.post("/api/jobs/train/upload")
+async def submit_train_upload_job(
+    file: UploadFile = File(...),
+    sheet: Optional[str] = Form(None),
+    epochs: int = Form(150),
+    lr: float = Form(0.001),
+    patience: int = Form(0),
+    min_delta: float = Form(0.0),
+):
+    """Як /api/train/upload, але одразу повертає job_id замість очікування результату."""
+    job, log_files = await _submit_upload_job(file, sheet, epochs, lr, patience, min_delta)
+    if job is None:
+        return _UPLOAD_PARSE_ERROR
+    return {**job.to_dict(), "log_files": log_files}
+
+
+@app.get("/api/jobs")
+def list_jobs():
+    return {"jobs": [job.to_dict() for job in _jobs.list()], "queued": _jobs.queue_depth()}
+
+
+@app.get("/api/jobs/{job_id}")
+def get_job(job_id: str):
+    """Статус і прогрес задачі: епохи, last_loss, avg_loss."""
+    job = _jobs.get(job_id)
+    if job is None:
+        return {"status": "error", "message": f"Задачу {job_id} не знайдено"}
+    return job.to_dict()
+
+
+@app.post("/api/jobs/{job_id}/cancel")
+def cancel_job(job_id: str):
+    """Скасувати задачу; частково навчена копія моделі відкидається."""
+    if not _jobs.cancel(job_id):
+        return {"status": "error", "message": f"Задачу {job_id} не знайдено або вже завершено"}
+    return {"status": "cancel_requested", "job_id": job_id}
+
+
+@app.get("/api/jobs/{job_id}/result")
+def get_job_result(job_id: str):
+    """Результат завершеної задачі з повною історією loss."""
+    job = _jobs.get(job_id)
+    if job is None:
+        return {"status": "error", "message": f"Задачу {job_id} не знайдено"}
+    if not job.finished:
+        return {"status": "error", "message": f"Задача {job_id} ще виконується", **job.to_dict()}
+    return {**job.to_dict(), "result": job.result, "loss_history": list(job.loss_history)}
 
 
 @app.post("/api/model/reset")
@@ -234,7 +1059,119 @@ def reset_model():
     """
     Скинути модель до нової ініціалізації
     """
-    global _model
-    _model = SimpleTransformer(input_seq_len=441, target_seq_len=441)
-    save_model(_model, MODEL_PATH)
+    global _trainer
+    model = SimpleTransformer(input_seq_len=441, target_seq_len=441)
+    _registry.publish(model, persist=lambda m: _save_checkpoint(m, extra={"kind": "reset"}))
+    _trainer = None  # тренер з новим Adam створиться з нової моделі
     return {"status": "reset", "input_len": 441, "target_len": 441}
+
+
+@app.get("/api/model/versions")
+def model_versions():
+    """Збережені версії чекпойнтів з метаданими (форма, loss, час) і версія, що зараз обслуговує запити."""
+    return {
+        "latest": _ckpts.latest_version(),
+        "serving_version": _registry.version,
+        "versions": _ckpts.list(),
+    }
+
+
+@app.post("/api/model/rollback")
+def rollback_model(body: RollbackJSON):
+    """Повернутися до збереженої версії чекпойнта: вона стає поточною і для передбачень, і для навчання."""
+    global _trainer
+    loaded = _ckpts.load(body.version)
+    if loaded is None:
+        return {"status": "error", "message": f"Чекпойнт v{body.version} не знайдено або пошкоджено"}
+    model, meta = loaded
+    _registry.publish(model, persist=lambda m: _ckpts.set_latest(body.version))
+    _trainer = None  # тренер перебудується з відновленої моделі та її стану Adam
+    return {"status": "rolled_back", "version": body.version, "meta": meta}
+
+
+@app.get("/api/model/inference-report")
+def inference_report(samples: int = 4):
+    """
+    Наскільки оптимізована збірка відрізняється від fp32:
+    збіг токенів, розбіжність логітів і час декодингу на семплах зі сховища (або випадкових X).
+    mode — фактичний режим знімка (compile без компілятора → fp32), requested_mode — INFERENCE_MODE.
+    """
+    snap = get_snapshot()
+    samples = max(1, min(32, samples))
+    store = get_dataset_store()
+    xs = [torch.from_numpy(store.get(i)[0]) for i in range(min(samples, len(store)))]
+    while len(xs) < samples:
+        xs.append(torch.rand(snap.model.input_seq_len))
+    report = compare_models(snap.model, snap.infer_model, xs)
+    return {
+        "mode": snap.infer_mode,
+        "requested_mode": INFERENCE_MODE,
+        "model_version": snap.version,
+        "threads": torch.get_num_threads(),
+        **report,
+    }
+
+
+@app.get("/api/model/nar/report")
+def nar_report(samples: int = 16, iterations: Optional[int] = None):
+    """
+    Точність Mask-Predict проти greedy-декодингу на розмічених семплах сховища
+    (спершу валідаційна частина): частка правильних клітинок, збіг режимів, час на семпл.
+    stale — голову навчено на енкодері іншої версії моделі (варто перенавчити).
+    Обидва режими рахуються на fp32-моделі (як і NAR у /api/predict); inference_mode — режим,
+    яким обслуговується greedy у /api/predict (для int8/compile його точність — /api/model/inference-report).
+    """
+    nar = get_nar_head()
+    if nar is None:
+        return {"status": "error", "message": "Голову Mask-Predict ще не навчено (/api/jobs/train/nar)."}
+    head, meta = nar
+    snap = get_snapshot()
+    store = get_dataset_store()
+    train_idx, val_idx = store.split(0.1)
+    picked = list(val_idx) + list(train_idx)
+    samples = max(1, min(64, samples))
+    xs, ys = [], []
+    for i in picked[:samples]:
+        x, y = store.get(int(i))
+        xs.append(torch.from_numpy(x))
+        ys.append(y)
+    if not xs:
+        return {"status": "error", "message": "У сховищі немає розмічених семплів для порівняння."}
+    report = compare_decoding(snap.model, head, xs, ys, iterations=iterations or NAR_ITERATIONS)
+    return {
+        "model_version": snap.version,
+        "head_base_version": meta.get("base_version"),
+        "stale": meta.get("base_version") != snap.version,
+        "encoder_mode": "fp32",
+        "inference_mode": snap.infer_mode,
+        **report,
+    }
+
+
+@app.get("/api/workers")
+def workers_health():
+    """Стан процесів пулу інференсу: живі/зайняті, версія чекпойнта, перезапуски, ping."""
+    if _pool is None:
+        return {"enabled": False, "workers": []}
+    return {"enabled": True, "workers": _pool.health()}
+
+
+@app.get("/api/cache/stats")
+def cache_stats():
+    """Лічильники кешу передбачень: hits / misses / hit_rate, розмір, версія моделі."""
+    return {**_pred_cache.stats(), "model_version": _registry.version}
+
+
+@app.get("/metrics")
+def metrics():
+    """Метрики у текстовому форматі Prometheus (гістограми ендпоїнтів і етапів, черги, кеш, версія)."""
+    return Response(_metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+@app.get("/api/profiles/{name}")
+def get_profile(name: str):
+    """Collapsed stacks профілю запиту (ім'я — із заголовка X-Profile-File) для flamegraph / speedscope."""
+    path = PROFILES_DIR / name
+    if Path(name).name != name or not path.is_file():
+        return {"status": "error", "message": f"Профіль {name} не знайдено"}
+    return PlainTextResponse(path.read_text(encoding="utf-8"))
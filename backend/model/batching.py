@@ -0,0 +1,102 @@
+import threading
+import time
+from concurrent.futures import Future
+from queue import Queue, Empty
+from typing import Callable, Dict, List, Optional, Tuple
+
+import torch
+
+from .transformer_model import pad_batch
+
+
+# ───────── Мікро-батчинг запитів на передбачення ─────────
+class MicroBatcher:
+    """
+    Збирає конкурентні запити /api/predict у батчі:
+      - після першого запиту чекає до window_ms або доки не набереться max_batch
+      - групує запити за довжиною X: bucket_width=0 — лише однакові довжини;
+        bucket_width>0 — кошики по bucket_width позицій, X у кошику доповнюються до найдовшого
+      - виконує run_batch(x: (B, Lx), src_key_padding_mask: (B, Lx) | None) → (B, Lt)
+        одним батчевим проходом
+    Кожен виклик submit() отримує власний Future з рядком результату (Lt,).
+    workers > 1 — стільки потоків паралельно збирають і виконують батчі
+    (має сенс, коли run_batch віддає роботу в пул процесів).
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[torch.Tensor, Optional[torch.Tensor]], torch.Tensor],
+        max_batch: int = 16,
+        window_ms: float = 5.0,
+        workers: int = 1,
+        bucket_width: int = 0,
+    ):
+        self._run_batch = run_batch
+        self.max_batch = max(1, int(max_batch))
+        self.window_s = max(0.0, float(window_ms)) / 1000.0
+        self.workers = max(1, int(workers))
+        self.bucket_width = max(0, int(bucket_width))
+        self._queue: "Queue[Tuple[torch.Tensor, Future]]" = Queue()
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+
+    def submit(self, x: torch.Tensor) -> Future:
+        """x: (Lx,) floats → Future[(Lt,) long]"""
+        fut: Future = Future()
+        self._ensure_started()
+        self._queue.put((x, fut))
+        return fut
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def _ensure_started(self):
+        if len(self._threads) == self.workers:
+            return
+        with self._lock:
+            while len(self._threads) < self.workers:
+                t = threading.Thread(target=self._loop, name=f"predict-batcher-{len(self._threads)}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def _collect(self) -> List[Tuple[torch.Tensor, Future]]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window_s
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    # вікно минуло — забрати лише те, що вже в черзі
+                    batch.append(self._queue.get_nowait())
+            except Empty:
+                break
+        return batch
+
+    def _bucket(self, length: int) -> int:
+        if self.bucket_width == 0:
+            return length
+        return (length + self.bucket_width - 1) // self.bucket_width
+
+    def _loop(self):
+        while True:
+            self._run(self._collect())
+
+    def _run(self, batch: List[Tuple[torch.Tensor, Future]]):
+        groups: Dict[int, List[Tuple[torch.Tensor, Future]]] = {}
+        for x, fut in batch:
+            # скасовані клієнтом запити не декодуємо
+            if fut.set_running_or_notify_cancel():
+                groups.setdefault(self._bucket(int(x.shape[-1])), []).append((x, fut))
+
+        for items in groups.values():
+            try:
+                xs, mask = pad_batch([x for x, _ in items])  # (B, max Lx), маска або None
+                out = self._run_batch(xs, mask)               # (B, Lt)
+                for i, (_, fut) in enumerate(items):
+                    fut.set_result(out[i])
+            except Exception as e:
+                for _, fut in items:
+                    if not fut.done():
+                        fut.set_exception(e)
@@ -0,0 +1,201 @@
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import torch
+
+from .transformer_model import SimpleTransformer, START_TOKEN, VOCAB_SIZE
+from .utils import atomic_torch_save
+
+# ───────── Версіоноване сховище чекпойнтів ─────────
+# root/
+#   v000001.pth   — {"meta": {...}, "state_dict": ..., "trainer": ...}
+#   v000001.json  — ті самі метадані окремо (перелік версій без torch.load)
+#   LATEST        — номер поточної версії; міняється атомарно (rename)
+# Проміжні найкращі ваги навчання (meta kind="best", make_latest=False) не є опублікованими
+# версіями: вони мають окремий ліміт keep_best і ніколи не стають кандидатами fallback-завантаження.
+FORMAT_VERSION = 1
+BEST_KIND = "best"
+_VERSION_RE = re.compile(r"^v(\d{6})\.pth$")
+
+
+def _atomic_write_text(path: Path, text: str):
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class CheckpointStore:
+    """
+    Атомарні версіоновані чекпойнти:
+      - кожне збереження — новий файл vNNNNNN.pth (temp → fsync → rename), LATEST оновлюється останнім
+      - метадані: форма моделі, словник, гіперпараметри, loss, час
+      - зберігаються останні keep_last опублікованих версій (+ поточна, навіть після rollback)
+        і окремо останні keep_best проміжних найкращих (kind="best") — вони не витісняють історію
+      - завантаження через mmap без копіювання state_dict; битий чекпойнт → попередня опублікована версія
+    """
+
+    def __init__(self, root: Union[str, Path], keep_last: int = 5, keep_best: int = 2):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.keep_last = max(1, int(keep_last))
+        self.keep_best = max(0, int(keep_best))
+        self._lock = threading.Lock()
+
+    def _pth(self, version: int) -> Path:
+        return self.root / f"v{version:06d}.pth"
+
+    def _json(self, version: int) -> Path:
+        return self.root / f"v{version:06d}.json"
+
+    # ───── Перелік ─────
+    def versions(self) -> List[int]:
+        out = []
+        for p in self.root.iterdir():
+            m = _VERSION_RE.match(p.name)
+            if m:
+                out.append(int(m.group(1)))
+        return sorted(out)
+
+    def _meta(self, version: int) -> Dict[str, Any]:
+        try:
+            return json.loads(self._json(version).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {"version": version}
+
+    def _is_best(self, version: int) -> bool:
+        return self._meta(version).get("kind") == BEST_KIND
+
+    def published_versions(self) -> List[int]:
+        """Версії, що були (або можуть бути) поточними — без проміжних kind="best"."""
+        return [v for v in self.versions() if not self._is_best(v)]
+
+    def latest_version(self) -> Optional[int]:
+        try:
+            return int((self.root / "LATEST").read_text(encoding="utf-8").strip())
+        except (OSError, ValueError):
+            published = self.published_versions()
+            return published[-1] if published else None
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Метадані всіх збережених версій (з .json, без читання ваг)."""
+        latest = self.latest_version()
+        out = []
+        for v in self.versions():
+            meta = self._meta(v)
+            meta["latest"] = v == latest
+            out.append(meta)
+        return out
+
+    # ───── Запис ─────
+    def save(
+        self,
+        model: SimpleTransformer,
+        trainer_state: Optional[dict] = None,
+        loss: Optional[float] = None,
+        extra: Optional[Dict[str, Any]] = None,
+        make_latest: bool = True,
+    ) -> int:
+        """
+        Зберегти нову версію і зробити її поточною. Повертає номер версії.
+        make_latest=False — лише зберегти (проміжні найкращі ваги навчання; доступні для rollback).
+        """
+        with self._lock:
+            versions = self.versions()
+            version = (versions[-1] + 1) if versions else 1
+            meta = {
+                "format": FORMAT_VERSION,
+                "version": version,
+                "created_at": time.time(),
+                "hparams": model.hparams(),
+                "vocab": {"size": VOCAB_SIZE, "start_token": START_TOKEN},
+                "loss": loss,
+                **(extra or {}),
+            }
+            ckpt = {"meta": meta, "state_dict": model.state_dict()}
+            if trainer_state is not None:
+                ckpt["trainer"] = trainer_state
+
+            atomic_torch_save(ckpt, self._pth(version))
+            _atomic_write_text(self._json(version), json.dumps(meta, ensure_ascii=False, indent=2))
+            if make_latest:
+                _atomic_write_text(self.root / "LATEST", str(version))
+            self._apply_retention(version)
+            return version
+
+    def set_latest(self, version: int):
+        """Rollback: зробити поточною вже збережену версію."""
+        if not self._pth(version).exists():
+            raise FileNotFoundError(f"Чекпойнт v{version} не знайдено")
+        with self._lock:
+            _atomic_write_text(self.root / "LATEST", str(version))
+
+    def _apply_retention(self, current: int):
+        versions = self.versions()
+        best = [v for v in versions if self._is_best(v)]
+        published = [v for v in versions if v not in set(best)]
+        keep = set(published[-self.keep_last:]) | {current, self.latest_version()}
+        if self.keep_best:
+            keep |= set(best[-self.keep_best:])
+        for v in versions:
+            if v in keep:
+                continue
+            for p in (self._pth(v), self._json(v)):
+                try:
+                    p.unlink()
+                except OSError:
+                    pass  # напр. файл ще змаплений (Windows) — приберемо наступного разу
+
+    # ───── Читання ─────
+    def _load_raw(self, version: int) -> Dict[str, Any]:
+        path = str(self._pth(version))
+        try:
+            # mmap: тензори state_dict читаються з файлу за потреби, без повної копії в пам'ять
+            return torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+        except Exception:
+            # формат без підтримки mmap / не лише тензори — звичайне завантаження
+            return torch.load(path, map_location="cpu", weights_only=False)
+
+    def load(self, version: Optional[int] = None) -> Optional[Tuple[SimpleTransformer, Dict[str, Any]]]:
+        """
+        Модель і метадані заданої версії (або поточної).
+        Якщо поточна версія бита — пробує попередні опубліковані (проміжні kind="best" —
+        ніколи: їх не публікували); None, якщо жодна не читається.
+        """
+        if version is not None:
+            candidates = [version]
+        else:
+            latest = self.latest_version()
+            candidates = [
+                v for v in reversed(self.versions())
+                if (latest is None or v <= latest) and (v == latest or not self._is_best(v))
+            ]
+
+        for v in candidates:
+            try:
+                ckpt = self._load_raw(v)
+                meta = ckpt["meta"]
+                # модель будується на meta-device (без ініціалізації ваг) і отримує тензори чекпойнта напряму
+                with torch.device("meta"):
+                    model = SimpleTransformer(**meta["hparams"])
+                model.load_state_dict(ckpt["state_dict"], assign=True)
+                return model, meta
+            except Exception:
+                continue
+        return None
+
+    def load_trainer_state(self, version: Optional[int] = None) -> Optional[dict]:
+        version = version if version is not None else self.latest_version()
+        if version is None:
+            return None
+        try:
+            return self._load_raw(version).get("trainer")
+        except Exception:
+            return None
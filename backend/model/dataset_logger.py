@@ -0,0 +1,213 @@
+import csv
+import threading
+import time
+from contextlib import nullcontext
+from pathlib import Path
+from queue import Empty, Queue
+from typing import Callable, ContextManager, List, Optional
+
+from .dataset_store import DatasetStore, hash64
+
+# ───────── Фонове логування завантажених семплів ─────────
+# Запит лише ставить (X, Y, sha256) у чергу; потік-логер:
+#   • дописує семпл у бінарне сховище (DatasetStore), пропускаючи вже відомий sha256 —
+#     дедуплікація за вмістом файлу, а не за іменем, і переживає прибирання UPLOADS_DIR
+#   • за бажанням пише й старий CSV-лог ({ts}__X.csv / {ts}__Y_0_440.csv) — але поза запитом
+#   • раз на retention_interval_s застосовує політику зберігання:
+#       сховище — компакція за розміром/віком (DatasetStore.compact)
+#       оригінали завантажень і CSV-логи — видалення найстаріших файлів за розміром/віком
+# Ліміт 0 — відповідне обмеження вимкнене.
+# stage_timer(stage) — контекст-менеджер заміру етапів "log" (запис семпла) і "retention".
+_DAY_S = 86400.0
+_CSV_SUFFIXES = ("__X.csv", "__Y_0_440.csv")
+
+
+class DatasetLogger:
+    def __init__(
+        self,
+        store_factory: Callable[[], DatasetStore],
+        uploads_dir: Optional[Path] = None,
+        csv_dir: Optional[Path] = None,
+        write_csv: bool = False,
+        store_max_bytes: int = 0,
+        store_max_age_days: float = 0.0,
+        uploads_max_bytes: int = 0,
+        uploads_max_age_days: float = 0.0,
+        retention_interval_s: float = 300.0,
+        max_queue: int = 1024,
+        stage_timer: Optional[Callable[[str], ContextManager]] = None,
+    ):
+        self._store_factory = store_factory
+        self._stage_timer = stage_timer or (lambda stage: nullcontext())
+        self.uploads_dir = Path(uploads_dir) if uploads_dir is not None else None
+        self.csv_dir = Path(csv_dir) if csv_dir is not None else None
+        self.write_csv = write_csv and self.csv_dir is not None
+        self.store_max_bytes = store_max_bytes
+        self.store_max_age_s = store_max_age_days * _DAY_S
+        self.uploads_max_bytes = uploads_max_bytes
+        self.uploads_max_age_s = uploads_max_age_days * _DAY_S
+        self.retention_interval_s = retention_interval_s
+
+        self._queue: "Queue" = Queue(maxsize=max_queue)
+        self._hashes: Optional[set] = None  # hash64 семплів у сховищі (ліниво, у потоці-логері)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._last_retention = 0.0
+
+        self.appended = 0
+        self.duplicates = 0
+        self.failed = 0
+        self.last_error: Optional[str] = None
+        self.last_retention: Optional[dict] = None
+
+    # ───── Життєвий цикл ─────
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="dataset-logger", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = 10.0):
+        """Дописати все, що в черзі, і зупинити потік."""
+        self._stop.set()
+        self._queue.put(None)
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Чекати, доки черга спорожніє (для тестів/бенчів); False — не встигли за timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    # ───── Запис ─────
+    def submit(self, X_list: List[float], Y_tokens: Optional[List[int]], sha256: Optional[str]):
+        """Поставити семпл у чергу; не блокує, поки черга не переповнена (тоді — чекає місця)."""
+        self.start()
+        self._queue.put((X_list, Y_tokens, sha256, time.time()))
+
+    def _run(self):
+        while True:
+            timeout = max(0.1, self.retention_interval_s) if self.retention_interval_s > 0 else None
+            try:
+                item = self._queue.get(timeout=timeout)
+            except Empty:
+                item = ()
+            try:
+                if item:
+                    with self._stage_timer("log"):
+                        self._log(*item)
+            except Exception as e:
+                self.failed += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+            finally:
+                if item != ():
+                    self._queue.task_done()
+            if item is None and self._stop.is_set() and self._queue.empty():
+                return
+            if self.retention_interval_s > 0 and time.monotonic() - self._last_retention >= self.retention_interval_s:
+                self.apply_retention()
+
+    def _log(self, X_list, Y_tokens, sha256, received_at):
+        store = self._store_factory()
+        if self._hashes is None:
+            self._hashes = store.hashes()
+        h = hash64(sha256)
+        if h and h in self._hashes:
+            self.duplicates += 1
+            return
+        store.append(X_list, Y_tokens, sha256=sha256)
+        if h:
+            self._hashes.add(h)
+        self.appended += 1
+        if self.write_csv:
+            self._write_csv(X_list, Y_tokens, received_at)
+
+    def _write_csv(self, X_list, Y_tokens, received_at: float):
+        """Формат, який розуміє DatasetStore.import_csv_logs: рядок заголовка + один рядок значень."""
+        ts = time.strftime("%Y%m%d_%H%M%S", time.localtime(received_at))
+        self.csv_dir.mkdir(parents=True, exist_ok=True)
+        rows = [(f"{ts}__X.csv", X_list)]
+        if Y_tokens is not None:
+            rows.append((f"{ts}__Y_0_440.csv", Y_tokens))
+        for name, values in rows:
+            with open(self.csv_dir / name, "w", newline="", encoding="utf-8") as f:
+                w = csv.writer(f)
+                w.writerow(range(len(values)))
+                w.writerow(values)
+
+    # ───── Retention ─────
+    def apply_retention(self) -> dict:
+        with self._stage_timer("retention"):
+            return self._apply_retention()
+
+    def _apply_retention(self) -> dict:
+        self._last_retention = time.monotonic()
+        report = {"at": time.time()}
+        try:
+            if self.store_max_bytes > 0 or self.store_max_age_s > 0:
+                report["store"] = self._store_factory().compact(self.store_max_bytes, self.store_max_age_s)
+                if report["store"]["removed"]:
+                    self._hashes = None  # перечитати після компакції
+            if self.uploads_dir is not None:
+                report["uploads"] = _prune_files(
+                    [p for p in self.uploads_dir.glob("*") if p.is_file() and not p.name.endswith(".part")],
+                    self.uploads_max_bytes,
+                    self.uploads_max_age_s,
+                )
+            if self.csv_dir is not None:
+                # лише логи запитів; base_X.csv / base_Y.csv не чіпаємо
+                logs = [p for p in self.csv_dir.glob("*__*.csv") if p.name.endswith(_CSV_SUFFIXES)]
+                report["csv_logs"] = _prune_files(logs, 0, self.uploads_max_age_s)
+        except Exception as e:
+            report["error"] = f"{type(e).__name__}: {e}"
+        self.last_retention = report
+        return report
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue_depth(),
+            "appended": self.appended,
+            "duplicates": self.duplicates,
+            "failed": self.failed,
+            "last_error": self.last_error,
+            "last_retention": self.last_retention,
+        }
+
+
+def _prune_files(paths: List[Path], max_bytes: int, max_age_s: float) -> dict:
+    """Видалити файли, старші за max_age_s, а далі найстаріші, доки сума розмірів > max_bytes."""
+    entries = []
+    for p in paths:
+        try:
+            st = p.stat()
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, p))
+    entries.sort(key=lambda e: e[0])  # найстаріші спершу
+
+    now = time.time()
+    total = sum(e[1] for e in entries)
+    removed, freed = 0, 0
+    for mtime, size, p in entries:
+        too_old = max_age_s > 0 and now - mtime > max_age_s
+        too_big = max_bytes > 0 and total > max_bytes
+        if not (too_old or too_big):
+            continue
+        try:
+            p.unlink()
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+        freed += size
+    return {"removed": removed, "freed_bytes": freed, "bytes": total}
@@ -0,0 +1,321 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, Optional, Set, Tuple, Union
+
+import numpy as np
+import torch
+
+# ───────── Формат сховища ─────────
+# x.f32   — усі X підряд, little-endian float32 (довжини можуть відрізнятися)
+# y.u8    — Y по 441 токену на семпл, uint8 (для семплів без Y — нулі)
+# index.i64 — по рядку на семпл: (x_offset, x_len, has_y, y_row)
+# meta.i64  — по рядку на семпл: (created_ns, hash64) — час додавання і перші 8 байт sha256
+#             завантаження (0 — невідомо). Старі сховища без meta: рядки на початку без метаданих.
+Y_LEN = 441
+_INDEX_COLS = 4
+_META_COLS = 2
+
+
+def hash64(sha256_hex: Optional[str]) -> int:
+    """Перші 8 байт sha256 (hex) → int64 для meta.i64; 0 — хешу немає."""
+    if not sha256_hex:
+        return 0
+    return int(np.frombuffer(bytes.fromhex(sha256_hex[:16]), dtype=">i8")[0]) or 1
+
+
+class DatasetStore:
+    """
+    Індексоване сховище всіх накопичених пар X/Y.
+    Запис — дописування в кінець трьох бінарних файлів (append-only),
+    читання — через np.memmap, без завантаження всього корпусу в пам'ять.
+    """
+
+    def __init__(self, root: Union[str, Path]):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.x_path = self.root / "x.f32"
+        self.y_path = self.root / "y.u8"
+        self.index_path = self.root / "index.i64"
+        self.meta_path = self.root / "meta.i64"
+        self._lock = threading.Lock()
+        self._pins = 0  # скільки читачів тримають індекси семплів (навчання) — компакцію відкладено
+
+    # ───── Запис ─────
+    def append(self, X_list, Y_tokens: Optional[List[int]] = None, sha256: Optional[str] = None) -> int:
+        """Дописати семпл; повертає його індекс. sha256 — хеш файлу-джерела (для дедуплікації)."""
+        x = np.ascontiguousarray(X_list, dtype="<f4").ravel()
+        y = np.zeros(Y_LEN, dtype=np.uint8)
+        if Y_tokens is not None:
+            yt = np.asarray(Y_tokens, dtype=np.uint8).ravel()[:Y_LEN]
+            y[: yt.size] = yt
+
+        with self._lock:
+            # зміщення — від фактичного розміру файлів: недописаний (без рядка індексу) семпл просто ігнорується
+            x_offset = self.x_path.stat().st_size // 4 if self.x_path.exists() else 0
+            y_row = self.y_path.stat().st_size // Y_LEN if self.y_path.exists() else 0
+            row = np.array([x_offset, x.size, int(Y_tokens is not None), y_row], dtype="<i8")
+            meta = np.array([time.time_ns(), hash64(sha256)], dtype="<i8")
+            with open(self.x_path, "ab") as f:
+                f.write(x.tobytes())
+            with open(self.y_path, "ab") as f:
+                f.write(y.tobytes())
+            self._align_meta_unlocked()
+            with open(self.meta_path, "ab") as f:
+                f.write(meta.tobytes())
+            # індекс пишемо останнім — семпл видно читачам лише після повного запису X/Y
+            with open(self.index_path, "ab") as f:
+                f.write(row.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            return self._count_unlocked() - 1
+
+    # ───── Читання ─────
+    def _count_unlocked(self) -> int:
+        if not self.index_path.exists():
+            return 0
+        return self.index_path.stat().st_size // (8 * _INDEX_COLS)
+
+    def __len__(self) -> int:
+        return self._count_unlocked()
+
+    def _meta_rows_unlocked(self) -> int:
+        return self.meta_path.stat().st_size // (8 * _META_COLS) if self.meta_path.exists() else 0
+
+    def _align_meta_unlocked(self):
+        """meta.i64 має рівно стільки рядків, скільки index: старі рядки без метаданих → нулі на початку."""
+        n, m = self._count_unlocked(), self._meta_rows_unlocked()
+        if m < n:
+            old = np.fromfile(self.meta_path, dtype="<i8") if m else np.zeros(0, dtype="<i8")
+            fixed = np.concatenate([np.zeros((n - m) * _META_COLS, dtype="<i8"), old])
+            _atomic_write_bytes(self.meta_path, fixed.tobytes())
+        elif m > n:
+            # недописаний семпл (падіння до запису індексу) — зайвий хвіст meta відкидаємо
+            with open(self.meta_path, "r+b") as f:
+                f.truncate(n * 8 * _META_COLS)
+
+    def meta(self) -> np.ndarray:
+        """(n, 2) int64: created_ns, hash64 по семплах (нулі — невідомо)."""
+        with self._lock:
+            n, m = self._count_unlocked(), self._meta_rows_unlocked()
+            out = np.zeros((n, _META_COLS), dtype="<i8")
+            if m:
+                rows = np.fromfile(self.meta_path, dtype="<i8").reshape(-1, _META_COLS)[:n]
+                out[n - len(rows):] = rows
+            return out
+
+    def hashes(self) -> Set[int]:
+        """hash64 усіх семплів з відомим джерелом."""
+        h = self.meta()[:, 1]
+        return {int(v) for v in h[h != 0]}
+
+    def _maps(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """memmap-и (index, x, y) на поточну кількість семплів."""
+        with self._lock:
+            return self._maps_unlocked()
+
+    def _maps_unlocked(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        n = len(self)
+        if n == 0:
+            return np.zeros((0, _INDEX_COLS), dtype="<i8"), np.zeros(0, dtype="<f4"), np.zeros((0, Y_LEN), dtype=np.uint8)
+        index = np.memmap(self.index_path, dtype="<i8", mode="r", shape=(n, _INDEX_COLS))
+        x_len = int(index[-1, 0] + index[-1, 1])
+        xs = np.memmap(self.x_path, dtype="<f4", mode="r", shape=(x_len,)) if x_len else np.zeros(0, dtype="<f4")
+        ys = np.memmap(self.y_path, dtype=np.uint8, mode="r", shape=(int(index[-1, 3]) + 1, Y_LEN))
+        return index, xs, ys
+
+    def get(self, i: int) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """Семпл i: (X float32, Y uint8 або None)."""
+        index, xs, ys = self._maps()
+        off, ln, has_y, y_row = (int(v) for v in index[i])
+        return np.array(xs[off : off + ln]), (np.array(ys[y_row]) if has_y else None)
+
+    def stats(self) -> dict:
+        index, _, _ = self._maps()
+        lengths = index[:, 1] if len(index) else np.zeros(0, dtype="<i8")
+        return {
+            "samples": int(len(index)),
+            "labeled": int(index[:, 2].sum()) if len(index) else 0,
+            "x_lengths": sorted({int(v) for v in np.unique(lengths)}),
+            "bytes": self.nbytes(),
+        }
+
+    def nbytes(self) -> int:
+        return sum(p.stat().st_size for p in (self.x_path, self.y_path, self.index_path, self.meta_path) if p.exists())
+
+    # ───── Компакція / retention ─────
+    def compact(self, max_bytes: int = 0, max_age_s: float = 0.0) -> dict:
+        """
+        Переписати сховище, лишивши лише семпли, що проходять політику:
+          max_age_s > 0 — видалити семпли, додані раніше (семпли з невідомим часом не старіють)
+          max_bytes > 0 — далі видаляти найстаріші, доки розмір не вкладеться в ліміт
+        Нові файли пишуться поруч і атомарно підміняють старі під тим самим lock, що й append
+        (відкриті memmap-и читачів продовжують бачити старі файли). Індекси семплів змінюються,
+        тому поки сховище закріплене (pinned), компакція пропускається.
+        """
+        with self._lock:
+            if self._pins:
+                return {"removed": 0, "kept": self._count_unlocked(), "bytes": self.nbytes(), "skipped": "pinned"}
+            index, xs, ys = self._maps_unlocked()
+            n = len(index)
+            if n == 0:
+                return {"removed": 0, "kept": 0, "bytes": self.nbytes()}
+            meta = np.zeros((n, _META_COLS), dtype="<i8")
+            m = self._meta_rows_unlocked()
+            if m:
+                rows = np.fromfile(self.meta_path, dtype="<i8").reshape(-1, _META_COLS)[:n]
+                meta[n - len(rows):] = rows
+
+            keep = np.ones(n, dtype=bool)
+            if max_age_s > 0:
+                cutoff = time.time_ns() - int(max_age_s * 1e9)
+                keep &= ~((meta[:, 0] != 0) & (meta[:, 0] < cutoff))
+            if max_bytes > 0:
+                row_bytes = index[:, 1] * 4 + Y_LEN + 8 * (_INDEX_COLS + _META_COLS)
+                # найновіші — в кінці; лишаємо суфікс, що вкладається в ліміт
+                kept_bytes = np.cumsum((row_bytes * keep)[::-1])[::-1]
+                keep &= kept_bytes <= max_bytes
+            if keep.all():
+                return {"removed": 0, "kept": n, "bytes": self.nbytes()}
+
+            rows_kept = np.flatnonzero(keep)
+            lens = index[rows_kept, 1]
+            new_offs = np.concatenate([[0], np.cumsum(lens)[:-1]]).astype("<i8")
+            new_index = np.stack(
+                [new_offs, lens, index[rows_kept, 2], np.arange(len(rows_kept), dtype="<i8")], axis=1
+            ).astype("<i8")
+            x_parts = [np.asarray(xs[int(index[i, 0]) : int(index[i, 0] + index[i, 1])]) for i in rows_kept]
+            new_x = np.concatenate(x_parts).astype("<f4") if x_parts else np.zeros(0, dtype="<f4")
+            new_y = np.ascontiguousarray(ys[index[rows_kept, 3]], dtype=np.uint8)
+
+            _atomic_write_bytes(self.meta_path, meta[rows_kept].astype("<i8").tobytes())
+            _atomic_write_bytes(self.x_path, new_x.tobytes())
+            _atomic_write_bytes(self.y_path, new_y.tobytes())
+            _atomic_write_bytes(self.index_path, new_index.tobytes())  # індекс — останнім
+            return {"removed": int(n - len(rows_kept)), "kept": int(len(rows_kept)), "bytes": self.nbytes()}
+
+    @contextmanager
+    def pinned(self):
+        """Індекси семплів не змінюються, поки контекст відкритий (на час навчання по корпусу)."""
+        with self._lock:
+            self._pins += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._pins -= 1
+
+    def split(self, val_fraction: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Розмічені семпли → (train, val) індекси.
+        Належність до val визначається хешем індексу семпла, тож вона стабільна, коли корпус
+        росте (семпл не перестрибує з val у train між запусками). Хоча б один семпл лишається в train.
+        """
+        index, _, _ = self._maps()
+        labeled = np.flatnonzero(index[:, 2] == 1) if len(index) else np.zeros(0, dtype=np.int64)
+        if val_fraction <= 0 or len(labeled) < 2:
+            return labeled, labeled[:0]
+        # мультиплікативний хеш Кнута → рівномірне [0, 1)
+        u = ((labeled.astype(np.uint64) * np.uint64(2654435761)) % np.uint64(1 << 32)) / float(1 << 32)
+        is_val = u < val_fraction
+        if is_val.all():
+            is_val[np.argmax(u)] = False
+        return labeled[~is_val], labeled[is_val]
+
+    def iter_batches(
+        self,
+        batch_size: int = 32,
+        shuffle: bool = True,
+        seed: Optional[int] = None,
+        labeled_only: bool = True,
+        indices: Optional[np.ndarray] = None,
+        bucket_width: int = 0,
+        shard: Optional[Tuple[int, int]] = None,
+    ) -> Iterator[Tuple[torch.Tensor, torch.Tensor, Optional[torch.Tensor]]]:
+        """
+        Одна епоха перемішаних міні-батчів (x: (B, Lx) float32, y: (B, 441) long, mask).
+        Семпли групуються за довжиною X: bucket_width=0 — лише однакові довжини (mask=None);
+        bucket_width>0 — кошики по bucket_width позицій, X доповнюються нулями до найдовшого
+        в батчі, mask: (B, Lx) bool, True — доповнена позиція (None, якщо доповнення не було).
+        indices — підмножина семплів (напр. train-частина), інакше весь корпус.
+        shard=(rank, world) — лише кожен world-ий батч епохи, починаючи з rank (DDP): за однакового
+        seed ранги ділять одну перестановку; кількість батчів на ранг однакова — хвіст
+        добирається батчами з початку епохи (кожен ранг робить стільки ж кроків, скільки інші).
+        """
+        index, xs, ys = self._maps()
+        if indices is None:
+            indices = np.arange(len(index))
+        if labeled_only and len(indices):
+            indices = indices[index[indices, 2] == 1]
+
+        rng = np.random.default_rng(seed)
+        batches: List[np.ndarray] = []
+        lengths = index[indices, 1] if len(indices) else np.zeros(0, dtype="<i8")
+        keys = (lengths + bucket_width - 1) // bucket_width if bucket_width > 0 else lengths
+        for key in np.unique(keys):
+            group = indices[keys == key]
+            if shuffle:
+                group = rng.permutation(group)
+            elif bucket_width > 0:
+                group = group[np.argsort(index[group, 1], kind="stable")]
+            batches.extend(group[i : i + batch_size] for i in range(0, len(group), batch_size))
+        if shuffle:
+            order = rng.permutation(len(batches))
+            batches = [batches[i] for i in order]
+        if shard is not None and batches:
+            rank, world = shard
+            total = -(-len(batches) // world) * world
+            batches = [batches[i % len(batches)] for i in range(rank, total, world)]
+
+        for b in batches:
+            lens = index[b, 1]
+            ln = int(lens.max())
+            offs = index[b, 0]
+            y = torch.from_numpy(np.asarray(ys[index[b, 3]], dtype=np.int64))
+            if (lens == ln).all():
+                # (B, Lx) одним gather-ом із memmap
+                x = np.asarray(xs[offs[:, None] + np.arange(ln)[None, :]], dtype=np.float32)
+                yield torch.from_numpy(x), y, None
+                continue
+            pos = np.arange(ln)[None, :]
+            pad = pos >= lens[:, None]
+            # доповнені позиції читають останній елемент свого X і потім обнуляються
+            gather = offs[:, None] + np.minimum(pos, np.maximum(lens[:, None] - 1, 0))
+            x = np.where(pad, 0.0, np.asarray(xs[gather], dtype=np.float32)).astype(np.float32)
+            yield torch.from_numpy(x), y, torch.from_numpy(pad)
+
+    # ───── Імпорт старих CSV-логів ─────
+    def import_csv_logs(self, datasets_dir: Union[str, Path]) -> int:
+        """
+        Імпортує пари {ts}__X.csv + {ts}__Y_0_440.csv (та base_X.csv + base_Y.csv),
+        які писав /api/train/upload до появи сховища. Повертає кількість доданих семплів.
+        """
+        import pandas as pd
+
+        datasets_dir = Path(datasets_dir)
+        pairs = [(p, p.with_name(p.name.replace("__X.csv", "__Y_0_440.csv"))) for p in sorted(datasets_dir.glob("*__X.csv"))]
+        base_x = datasets_dir / "base_X.csv"
+        if base_x.exists():
+            pairs.insert(0, (base_x, datasets_dir / "base_Y.csv"))
+
+        added = 0
+        for x_path, y_path in pairs:
+            try:
+                x = pd.read_csv(x_path).to_numpy(dtype=np.float32)[0]
+                y = pd.read_csv(y_path).to_numpy().ravel().astype(np.int64).tolist() if y_path.exists() else None
+            except Exception:
+                continue
+            self.append(x, y)
+            added += 1
+        return added
+
+
+def _atomic_write_bytes(path: Path, data: bytes):
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
@@ -0,0 +1,236 @@
+import os
+import shutil
+import socket
+import tempfile
+from pathlib import Path
+from queue import Empty
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as tmp
+from torch.nn.parallel import DistributedDataParallel
+
+from .dataset_store import DatasetStore
+from .trainer import CheckpointCallback, EarlyStopping, EpochCallback, Trainer
+from .transformer_model import SimpleTransformer, shift_right
+from .utils import atomic_torch_save
+
+# ───────── Data-parallel навчання по корпусу (DDP, gloo, localhost) ─────────
+# Тренувальний потік API лишається координатором, а навчання йде в world_size процесах:
+#   init.pt   — ваги + стан тренера (Adam, шедулери), з яких стартує кожен ранг
+#   ранги     — однакова перестановка батчів епохи (спільний seed), ранг r бере кожен world-ий
+#               батч (DatasetStore.iter_batches(shard=...)), градієнти усереднює DDP (all-reduce)
+#   метрики   — train/val loss зводяться all-reduce, тож рання зупинка і ReduceLROnPlateau
+#               приймають однакові рішення в усіх рангах
+#   rank 0    — єдиний, хто пише: прогрес у чергу, проміжні найкращі ваги і result.pt
+# Координатор переносить result.pt у свій Trainer — далі звичайна публікація і чекпойнт.
+# Глобальний батч ≈ batch_size: кожен ранг бере ceil(batch_size / world_size) семплів.
+_POLL_S = 0.1
+
+
+class _Cancelled(Exception):
+    """Координатор попросив зупинитись (скасування задачі) — ранги виходять узгоджено."""
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _strip_ddp(state: Dict[str, torch.Tensor]) -> Dict[str, torch.Tensor]:
+    return {k[len("module."):] if k.startswith("module.") else k: v for k, v in state.items()}
+
+
+def _worker_main(rank: int, world_size: int, port: int, store_root: str, run_dir: str, cfg: dict, events, cancel):
+    """Точка входу рангу (torch.multiprocessing.spawn)."""
+    torch.set_num_threads(cfg["threads"])
+    dist.init_process_group("gloo", init_method=f"tcp://127.0.0.1:{port}", rank=rank, world_size=world_size)
+    try:
+        run_dir = Path(run_dir)
+        init = torch.load(run_dir / "init.pt", map_location="cpu", weights_only=False)
+        model = SimpleTransformer(**init["hparams"])
+        model.load_state_dict(init["model"])
+        trainer = Trainer(DistributedDataParallel(model), lr=init["lr"], **init["options"])
+        trainer.load_state_dict(init["trainer"])
+
+        store = DatasetStore(store_root)
+        train_idx, val_idx = store.split(cfg["val_fraction"])
+        val_part = val_idx[rank::world_size]
+        rng = np.random.default_rng(cfg["seed"])
+        shard_batch = max(1, -(-cfg["batch_size"] // world_size))
+
+        def run_epoch() -> float:
+            total, count = 0.0, 0
+            batches = store.iter_batches(
+                batch_size=shard_batch,
+                shuffle=True,
+                seed=int(rng.integers(1 << 31)),
+                indices=train_idx,
+                bucket_width=cfg["bucket_width"],
+                shard=(rank, world_size),
+            )
+            for x, y, mask in batches:
+                loss = trainer._step(x, shift_right(y), y, mask)
+                total += loss * x.size(0)
+                count += x.size(0)
+            agg = torch.tensor([total, count, float(cancel.is_set())], dtype=torch.float64)
+            dist.all_reduce(agg)
+            if agg[2] > 0:
+                raise _Cancelled()
+            if agg[1] == 0:
+                raise ValueError("У сховищі датасетів немає семплів з Y")
+            return float(agg[0] / agg[1])
+
+        def validate() -> float:
+            part = trainer.evaluate(store, val_part, cfg["batch_size"], cfg["bucket_width"]) if len(val_part) else 0.0
+            agg = torch.tensor([part * len(val_part), len(val_part)], dtype=torch.float64)
+            dist.all_reduce(agg)
+            return float(agg[0] / agg[1])
+
+        def on_epoch(loss: float, val_loss: Optional[float]):
+            events.put(("epoch", loss, val_loss))
+
+        def on_checkpoint(state, metric: float, epoch: int):
+            path = run_dir / f"best_{epoch:06d}.pt"
+            atomic_torch_save(_strip_ddp(state), path)
+            events.put(("checkpoint", str(path), metric, epoch))
+
+        stopper = EarlyStopping(**cfg["early_stopping"]) if cfg["early_stopping"] is not None else None
+        try:
+            trainer._run_epochs(
+                run_epoch,
+                cfg["epochs"],
+                on_epoch if rank == 0 else None,
+                validate if len(val_idx) else None,
+                stopper,
+                on_checkpoint if rank == 0 else None,
+                cfg["checkpoint_every"],
+            )
+        except _Cancelled:
+            return
+        if rank == 0:
+            atomic_torch_save(
+                {
+                    "model": model.state_dict(),
+                    "trainer": trainer.state_dict(),
+                    "early_stopping": vars(stopper) if stopper is not None else None,
+                },
+                run_dir / "result.pt",
+            )
+    finally:
+        dist.destroy_process_group()
+
+
+def fit_dataset_ddp(
+    trainer: Trainer,
+    store: DatasetStore,
+    epochs: int,
+    world_size: int,
+    batch_size: int = 32,
+    on_epoch: Optional[EpochCallback] = None,
+    seed: Optional[int] = None,
+    val_fraction: float = 0.0,
+    early_stopping: Optional[EarlyStopping] = None,
+    on_checkpoint: Optional[CheckpointCallback] = None,
+    checkpoint_every: int = 0,
+    bucket_width: int = 0,
+    threads_per_worker: int = 0,
+) -> List[float]:
+    """
+    Те саме, що Trainer.fit_dataset, але в world_size процесах. Після завершення trainer.model,
+    оптимізатор і шедулери містять результат (як після звичайного fit_dataset).
+    on_epoch / on_checkpoint викликаються в потоці координатора; виняток з on_epoch
+    (напр. JobCancelled) зупиняє ранги після поточної епохи і прокидається далі.
+    threads_per_worker=0 — ядра порівну між рангами.
+    """
+    world_size = max(1, int(world_size))
+    if seed is None:
+        seed = int(np.random.default_rng().integers(1 << 31))
+    threads = threads_per_worker or max(1, (os.cpu_count() or 1) // world_size)
+    cfg: Dict[str, Any] = {
+        "epochs": epochs,
+        "batch_size": batch_size,
+        "seed": seed,
+        "val_fraction": val_fraction,
+        "bucket_width": bucket_width,
+        "checkpoint_every": checkpoint_every,
+        "threads": threads,
+        "early_stopping": (
+            {"patience": early_stopping.patience, "min_delta": early_stopping.min_delta}
+            if early_stopping is not None
+            else None
+        ),
+    }
+
+    run_dir = Path(tempfile.mkdtemp(prefix="ddp-"))
+    ctx = tmp.get_context("spawn")
+    events = ctx.Queue()
+    cancel = ctx.Event()
+    loss_hist: List[float] = []
+    error: Optional[BaseException] = None
+
+    def handle(msg):
+        nonlocal error
+        try:
+            if msg[0] == "epoch":
+                loss_hist.append(msg[1])
+                if on_epoch is not None:
+                    on_epoch(msg[1], msg[2])
+            elif msg[0] == "checkpoint":
+                path = Path(msg[1])
+                if on_checkpoint is not None:
+                    on_checkpoint(torch.load(path, map_location="cpu", weights_only=True), msg[2], msg[3])
+                path.unlink(missing_ok=True)
+        except BaseException as e:
+            if error is None:
+                error = e
+            cancel.set()
+
+    def drain():
+        while True:
+            try:
+                handle(events.get_nowait())
+            except Empty:
+                return
+
+    try:
+        atomic_torch_save(
+            {
+                "hparams": trainer.model.hparams(),
+                "model": trainer.model.state_dict(),
+                "trainer": trainer.state_dict(),
+                "options": trainer.options(),
+                "lr": trainer.base_lr,
+            },
+            run_dir / "init.pt",
+        )
+        procs = tmp.spawn(
+            _worker_main,
+            args=(world_size, _free_port(), str(store.root), str(run_dir), cfg, events, cancel),
+            nprocs=world_size,
+            join=False,
+        )
+        try:
+            while not procs.join(timeout=_POLL_S):
+                drain()
+        except BaseException:
+            cancel.set()
+            for p in procs.processes:
+                if p.is_alive():
+                    p.terminate()
+            raise
+        drain()  # процес перед виходом дописує свою чергу в канал — решта подій уже тут
+        if error is not None:
+            raise error
+
+        result = torch.load(run_dir / "result.pt", map_location="cpu", weights_only=False)
+        trainer.model.load_state_dict(result["model"])
+        trainer.load_state_dict(result["trainer"])
+        if early_stopping is not None and result["early_stopping"] is not None:
+            vars(early_stopping).update(result["early_stopping"])
+        return loss_hist
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
@@ -0,0 +1,134 @@
+import copy
+import time
+import warnings
+from typing import List, Optional
+
+import torch
+import torch.nn as nn
+
+from .transformer_model import SimpleTransformer, predict_tokens_greedy_batch, shift_right, START_TOKEN
+
+# ───────── Оптимізований CPU-інференс ─────────
+# fp32    — модель як є (eager float32)
+# int8    — динамічна int8-квантизація nn.Linear (FFN, fc_out, input_embed); ваги уваги лишаються fp32
+# compile — torch.compile кроку декодера (decode_step) і енкодера; без компілятора → fallback на fp32
+# Фактичний режим збірки — атрибут inference_mode (у fp32 і при fallback його немає → inference_mode_of).
+INFERENCE_MODES = ("fp32", "int8", "compile")
+
+
+def configure_threads(intra_op: Optional[int] = None, inter_op: Optional[int] = None):
+    """Налаштування потоків intra-/inter-op для CPU-інференсу (None — залишити як є)."""
+    if intra_op:
+        torch.set_num_threads(int(intra_op))
+    if inter_op:
+        try:
+            # дозволено лише до першої паралельної роботи в процесі
+            torch.set_num_interop_threads(int(inter_op))
+        except RuntimeError:
+            pass
+
+
+def build_inference_model(model: SimpleTransformer, mode: str = "fp32") -> SimpleTransformer:
+    """
+    Оптимізована для інференсу версія моделі (вихідна модель не змінюється).
+    Викликається при завантаженні/публікації знімка в реєстрі.
+    Якщо compile не вдався — RuntimeWarning і вихідна fp32-модель (inference_mode_of → "fp32").
+    """
+    if mode not in INFERENCE_MODES:
+        raise ValueError(f"Невідомий режим інференсу '{mode}', очікується один з {INFERENCE_MODES}")
+    model.eval()
+
+    if mode == "int8":
+        qmodel = torch.ao.quantization.quantize_dynamic(copy.deepcopy(model), {nn.Linear}, dtype=torch.qint8)
+        qmodel.eval()
+        qmodel.inference_mode = "int8"
+        return qmodel
+
+    if mode == "compile":
+        # поверхнева копія: спільні (незмінні) ваги, власні скомпільовані методи
+        cmodel = copy.copy(model)
+        try:
+            cmodel.decode_step = torch.compile(model.decode_step, dynamic=True)
+            cmodel.encode = torch.compile(model.encode, dynamic=True)
+            # прогрів: компіляція відбувається на першому виклику — помилки ловимо тут, а не в запиті
+            x = torch.zeros((1, model.input_seq_len), dtype=torch.float32)
+            predict_tokens_greedy_batch(cmodel, x, max_len=2, start_token=START_TOKEN)
+            cmodel.inference_mode = "compile"
+            return cmodel
+        except Exception as e:
+            warnings.warn(
+                f"torch.compile недоступний ({type(e).__name__}: {e}) — інференс у fp32",
+                RuntimeWarning,
+                stacklevel=2,
+            )
+            return model
+
+    return model
+
+
+def inference_mode_of(model: SimpleTransformer) -> str:
+    """Режим, у якому фактично зібрано модель build_inference_model (а не запитаний)."""
+    return getattr(model, "inference_mode", "fp32")
+
+
+def warm_up(model: SimpleTransformer, input_len: int = 0, batch_size: int = 1) -> float:
+    """
+    Повний прогін декодингу на нулях: перші виклики ядер, алокатор, позиційні таблиці й маски —
+    до першого реального запиту. input_len=0 — довжина входу моделі. Повертає тривалість, с.
+    """
+    x = torch.zeros((max(1, batch_size), input_len or model.input_seq_len), dtype=torch.float32)
+    t0 = time.perf_counter()
+    predict_tokens_greedy_batch(model, x, max_len=model.target_seq_len, start_token=START_TOKEN)
+    return time.perf_counter() - t0
+
+
+def compare_models(
+    ref: SimpleTransformer,
+    opt: SimpleTransformer,
+    xs: List[torch.Tensor],
+    max_len: Optional[int] = None,
+) -> dict:
+    """
+    Звіт про розбіжність оптимізованої моделі з еталонною fp32:
+      token_agreement — частка збіжних токенів greedy-декодингу
+      exact_match_rate — частка семплів з повністю однаковою матрицею
+      max/mean_abs_logit_diff — на teacher-forced логітах по еталонних токенах
+      ref_ms / opt_ms — середній час декодингу одного семпла
+    """
+    max_len = max_len or ref.target_seq_len
+    agree, exact, total = 0, 0, 0
+    max_diff, sum_diff, n_diff = 0.0, 0.0, 0
+    ref_s, opt_s = 0.0, 0.0
+
+    with torch.no_grad():
+        for x in xs:
+            x = x.view(1, -1)
+            t0 = time.perf_counter()
+            ref_tokens = predict_tokens_greedy_batch(ref, x, max_len=max_len)
+            t1 = time.perf_counter()
+            opt_tokens = predict_tokens_greedy_batch(opt, x, max_len=max_len)
+            t2 = time.perf_counter()
+            ref_s += t1 - t0
+            opt_s += t2 - t1
+
+            same = (ref_tokens == opt_tokens)
+            agree += int(same.sum())
+            exact += int(bool(same.all()))
+            total += same.numel()
+
+            tgt = shift_right(ref_tokens)
+            diff = (ref(x, tgt) - opt(x, tgt)).abs()
+            max_diff = max(max_diff, float(diff.max()))
+            sum_diff += float(diff.sum())
+            n_diff += diff.numel()
+
+    n = max(1, len(xs))
+    return {
+        "samples": len(xs),
+        "token_agreement": (agree / total) if total else 1.0,
+        "exact_match_rate": exact / n,
+        "max_abs_logit_diff": max_diff,
+        "mean_abs_logit_diff": (sum_diff / n_diff) if n_diff else 0.0,
+        "ref_ms": 1000.0 * ref_s / n,
+        "opt_ms": 1000.0 * opt_s / n,
+    }
@@ -0,0 +1,172 @@
+import io
+from pathlib import Path
+from typing import BinaryIO, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+# ───────── Однопрохідне читання табличних файлів ─────────
+# Файл читається рівно один раз (CSV — одна таблиця, XLSX — одне відкриття workbook з розбором
+# лише потрібних аркушів), далі розкладка визначається на готових DataFrame, а клітинки
+# конвертуються одразу в NumPy.
+X_COLS = ("X", "x", "X_data", "x_data")
+Y_COLS = ("Y", "y", "Y_data", "y_data")
+Y_LEN = 441
+
+Source = Union[bytes, bytearray, memoryview, BinaryIO, str, Path]
+
+
+def _as_input(source: Source):
+    """bytes → BytesIO; file-like перемотується на початок; шлях передається pandas як є."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    if hasattr(source, "seek"):
+        source.seek(0)
+    return source
+
+
+def _is_excel(filename: Optional[str]) -> bool:
+    return bool(filename) and filename.lower().endswith(".xlsx")
+
+
+class TabularSource:
+    """
+    Розібраний файл:
+      x_frame — таблиця з X (для XLSX: аркуш sheet_name → 'X' → перший)
+      y_frame — аркуш 'Y' (лише XLSX), якщо він є
+    """
+
+    def __init__(self, x_frame: pd.DataFrame, y_frame: Optional[pd.DataFrame] = None, sheets: Optional[List[str]] = None):
+        self.x_frame = x_frame
+        self.y_frame = y_frame
+        self.sheets = sheets or []
+
+
+def read_tabular(source: Source, filename: Optional[str], sheet_name: Optional[str] = None) -> TabularSource:
+    """Прочитати CSV/XLSX один раз. Невідомі розширення читаються як CSV."""
+    src = _as_input(source)
+    if not _is_excel(filename):
+        return TabularSource(pd.read_csv(src))
+
+    with pd.ExcelFile(src) as xf:
+        sheets = list(xf.sheet_names)
+        x_sheet = next((s for s in (sheet_name, "X", sheets[0] if sheets else None) if s and s in sheets), None)
+        if x_sheet is None:
+            raise ValueError("Excel doesn't contain readable sheets")
+        x_frame = xf.parse(x_sheet)
+        y_frame = xf.parse("Y") if ("Y" in sheets and x_sheet != "Y") else None
+    return TabularSource(x_frame, y_frame, sheets)
+
+
+# ───────── Клітинки → NumPy ─────────
+def _split_cell(cell, dtype) -> np.ndarray:
+    """'0.1, 0.5;1' → array([0.1, 0.5, 1.0])"""
+    parts = [p.strip() for p in str(cell).replace(";", ",").split(",")]
+    return np.array([p for p in parts if p], dtype=np.float64).astype(dtype)
+
+
+def normalize_y(y: np.ndarray) -> np.ndarray:
+    """Привести Y до 441 токенів (обрізати/допадити нулями), int64."""
+    y = np.asarray(y).ravel()
+    y = np.trunc(y.astype(np.float64)).astype(np.int64) if y.dtype.kind == "f" else y.astype(np.int64)
+    if y.size < Y_LEN:
+        return np.concatenate([y, np.zeros(Y_LEN - y.size, dtype=np.int64)])
+    return y[:Y_LEN]
+
+
+def _first(df: pd.DataFrame, names) -> Optional[str]:
+    return next((c for c in df.columns if c in names), None)
+
+
+def _y_prefixed(df: pd.DataFrame) -> List:
+    return [c for c in df.columns if str(c).lower().startswith("y_")]
+
+
+def _numeric_x(df: pd.DataFrame) -> pd.DataFrame:
+    """Числові стовпці без Y (колонки 'Y' / 'Y_*' не є ознаками X)."""
+    cols = [c for c in df.columns if c not in Y_COLS and not str(c).lower().startswith("y_")]
+    return df[cols].select_dtypes(include=["number"])
+
+
+def x_from_frame(df: Optional[pd.DataFrame]) -> Optional[np.ndarray]:
+    """X першого запису: стовпець 'X' з комами або перший рядок числових стовпців."""
+    if df is None or df.empty:
+        return None
+    col = _first(df, X_COLS)
+    if col is not None:
+        try:
+            return _split_cell(df[col].iloc[0], np.float32)
+        except (ValueError, TypeError):
+            pass
+    numeric = _numeric_x(df)
+    if numeric.shape[0] >= 1 and numeric.shape[1] >= 1:
+        return numeric.iloc[0].to_numpy(dtype=np.float32)
+    return None
+
+
+def y_from_frame(df: Optional[pd.DataFrame]) -> Optional[np.ndarray]:
+    """Y першого запису: стовпець 'Y' з комами або стовпці 'Y_0..Y_440'."""
+    if df is None or df.empty:
+        return None
+    col = _first(df, Y_COLS)
+    if col is not None:
+        try:
+            return normalize_y(_split_cell(df[col].iloc[0], np.float64))
+        except (ValueError, TypeError):
+            pass
+    y_cols = _y_prefixed(df)
+    if y_cols:
+        y_df = df[y_cols].select_dtypes(include=["number"])
+        if not y_df.empty:
+            return normalize_y(y_df.iloc[0].to_numpy())
+    return None
+
+
+def y_from_sheet(df: Optional[pd.DataFrame]) -> Optional[np.ndarray]:
+    """Аркуш 'Y': матриця 21x21 (або будь-які ≥441 числових клітинок) построчно."""
+    if df is None or df.empty:
+        return None
+    numeric = df.select_dtypes(include=["number"])
+    if numeric.size == 0:
+        return None
+    return normalize_y(numeric.to_numpy().ravel())
+
+
+def extract_xy(src: TabularSource) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+    """
+    Визначення розкладки на вже прочитаних даних:
+      - X: стовпець 'X' з комами або перший рядок числових стовпців
+      - Y: аркуш 'Y' (XLSX), стовпець 'Y' з комами або стовпці 'Y_*'
+    """
+    x = x_from_frame(src.x_frame)
+    y = y_from_sheet(src.y_frame) if src.y_frame is not None else None
+    if y is None:
+        y = y_from_frame(src.x_frame)
+    return x, y
+
+
+def x_rows_from_frame(df: Optional[pd.DataFrame]) -> Optional[List[np.ndarray]]:
+    """Багато X — по одному на рядок (стовпець 'X' з комами або рядки числових стовпців)."""
+    if df is None or df.empty:
+        return None
+    col = _first(df, X_COLS)
+    if col is not None:
+        try:
+            return [_split_cell(cell, np.float32) for cell in df[col].dropna()]
+        except (ValueError, TypeError):
+            pass
+    numeric = _numeric_x(df)
+    if numeric.shape[0] >= 1 and numeric.shape[1] >= 1:
+        return list(numeric.to_numpy(dtype=np.float32))
+    return None
+
+
+def iter_x_row_chunks_csv(source: Source, chunksize: int = 1024) -> Iterator[List[np.ndarray]]:
+    """
+    Потокове читання великого CSV: по chunksize рядків за раз, без завантаження всього файлу.
+    Кожен елемент — список X (float32) одного чанка.
+    """
+    for chunk in pd.read_csv(_as_input(source), chunksize=chunksize):
+        rows = x_rows_from_frame(chunk)
+        if rows:
+            yield rows
@@ -0,0 +1,165 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from queue import Queue
+from typing import Any, Callable, Dict, List, Optional
+
+LOSS_HISTORY_MAX = 1000  # скільки останніх значень loss тримати на задачу
+
+
+# ───────── Фонові задачі навчання ─────────
+class JobCancelled(Exception):
+    """Задачу скасовано під час виконання."""
+
+
+class TrainingJob:
+    """
+    Одна задача навчання:
+      status: queued → running → done | failed | cancelled
+      epochs_done / epochs_total, last_loss, avg_loss, val_loss — прогрес для опитування
+      loss_history — лише останні LOSS_HISTORY_MAX епох (avg_loss рахується по всіх)
+      future — завершується результатом (dict) або винятком, щоб на задачу можна було чекати
+    """
+
+    def __init__(self, kind: str, params: Dict[str, Any], epochs_total: int):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.status = "queued"
+        self.epochs_total = epochs_total
+        self.epochs_done = 0
+        self.last_loss: Optional[float] = None
+        self.avg_loss: Optional[float] = None
+        self.val_loss: Optional[float] = None
+        self.loss_history: "deque[float]" = deque(maxlen=LOSS_HISTORY_MAX)
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.future: Future = Future()
+        self._cancel = threading.Event()
+        self._loss_sum = 0.0
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed", "cancelled")
+
+    def cancel_requested(self) -> bool:
+        return self._cancel.is_set()
+
+    def report(self, loss: float, val_loss: Optional[float] = None):
+        """Викликається тренувальним циклом після кожної епохи; кидає JobCancelled, якщо задачу скасовано."""
+        self.epochs_done += 1
+        self.last_loss = loss
+        self.val_loss = val_loss
+        self._loss_sum += loss
+        self.avg_loss = self._loss_sum / self.epochs_done
+        self.loss_history.append(loss)
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "epochs_done": self.epochs_done,
+            "epochs_total": self.epochs_total,
+            "progress": (self.epochs_done / self.epochs_total) if self.epochs_total else 0.0,
+            "last_loss": self.last_loss,
+            "avg_loss": self.avg_loss,
+            "val_loss": self.val_loss,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class TrainingJobManager:
+    """
+    Черга задач навчання з одним виділеним потоком-воркером.
+    run_job(job) виконує навчання (на копії моделі) і повертає dict-результат;
+    воно має викликати job.report(loss[, val_loss]) після кожної епохи.
+    """
+
+    def __init__(self, run_job: Callable[[TrainingJob], Dict[str, Any]], max_jobs: int = 100):
+        self._run_job = run_job
+        self.max_jobs = max(1, int(max_jobs))
+        self._queue: "Queue[TrainingJob]" = Queue()
+        self._jobs: "OrderedDict[str, TrainingJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, kind: str, params: Dict[str, Any], epochs_total: int) -> TrainingJob:
+        job = TrainingJob(kind, params, epochs_total)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._evict_locked()
+        self._ensure_started()
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[TrainingJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[TrainingJob]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def cancel(self, job_id: str) -> bool:
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return False
+        job._cancel.set()
+        return True
+
+    def _evict_locked(self):
+        # прибрати найстаріші завершені задачі понад ліміт
+        for jid in [j.id for j in self._jobs.values() if j.finished]:
+            if len(self._jobs) <= self.max_jobs:
+                break
+            del self._jobs[jid]
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="train-worker", daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            job = self._queue.get()
+            if job.cancel_requested():
+                self._finish(job, "cancelled")
+                continue
+
+            job.status = "running"
+            job.started_at = time.time()
+            try:
+                job.result = self._run_job(job)
+                self._finish(job, "done")
+            except JobCancelled:
+                self._finish(job, "cancelled")
+            except Exception as e:
+                job.error = str(e)
+                self._finish(job, "failed", e)
+
+    def _finish(self, job: TrainingJob, status: str, exc: Optional[BaseException] = None):
+        job.status = status
+        job.finished_at = time.time()
+        if exc is not None:
+            job.future.set_exception(exc)
+        elif status == "cancelled":
+            job.future.set_exception(JobCancelled())
+        else:
+            job.future.set_result(job.result)
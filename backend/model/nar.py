@@ -0,0 +1,281 @@
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.optim as optim
+
+from .dataset_store import DatasetStore
+from .transformer_model import SimpleTransformer, pad_batch, predict_tokens_greedy_batch, VOCAB_SIZE
+from .utils import atomic_torch_save
+
+# ───────── Неавторегресивний декодинг (Mask-Predict) ─────────
+# Голова поверх енкодера SimpleTransformer передбачає всі 441 клітинки одночасно:
+#   ітерація 0 — усі позиції MASK → прогноз усіх клітинок одним проходом
+#   ітерація t — найменш упевнені n = L·(T−t)/T клітинок знову маскуються і передбачаються
+# Енкодер базової моделі заморожений (лише читання знімка), тож навчання голови не змінює
+# greedy-модель. Голова зберігається окремим файлом із версією базової моделі, на якій навчена.
+MASK_TOKEN = VOCAB_SIZE  # поза словником AR-моделі
+
+
+class MaskPredictHead(nn.Module):
+    def __init__(
+        self,
+        d_model: int = 128,
+        nhead: int = 8,
+        num_layers: int = 2,
+        target_len: int = 441,
+        vocab_size: int = VOCAB_SIZE,
+    ):
+        super().__init__()
+        self.d_model = d_model
+        self.nhead = nhead
+        self.num_layers = num_layers
+        self.target_len = target_len
+        self.vocab_size = vocab_size
+
+        self.token_embed = nn.Embedding(vocab_size + 1, d_model)  # + MASK
+        self.pos_embed = nn.Embedding(target_len, d_model)         # фіксована довжина виходу
+        layer = nn.TransformerDecoderLayer(d_model=d_model, nhead=nhead, batch_first=True)
+        self.decoder = nn.TransformerDecoder(layer, num_layers=num_layers)
+        self.fc_out = nn.Linear(d_model, vocab_size)
+
+    def hparams(self) -> dict:
+        return {
+            "d_model": self.d_model,
+            "nhead": self.nhead,
+            "num_layers": self.num_layers,
+            "target_len": self.target_len,
+            "vocab_size": self.vocab_size,
+        }
+
+    @classmethod
+    def for_model(cls, model: SimpleTransformer, **kwargs) -> "MaskPredictHead":
+        """Голова під розмірність і довжину виходу базової моделі."""
+        return cls(d_model=model.d_model, nhead=model.nhead, target_len=model.target_seq_len, **kwargs)
+
+    def forward(
+        self,
+        memory: torch.Tensor,                                   # (Ls, B, d) — SimpleTransformer.encode
+        tokens: torch.Tensor,                                   # (B, Lt) long, MASK — невідомі клітинки
+        memory_key_padding_mask: Optional[torch.Tensor] = None,  # (B, Ls) bool, True — доповнення
+    ) -> torch.Tensor:
+        """return: (B, Lt, vocab). Без каузальної маски — кожна клітинка бачить усі інші."""
+        h = self.token_embed(tokens) + self.pos_embed.weight[None, : tokens.size(1)]
+        out = self.decoder(h, memory.permute(1, 0, 2), memory_key_padding_mask=memory_key_padding_mask)
+        return self.fc_out(out)
+
+
+# ───────── Декодинг ─────────
+def mask_predict(
+    model: SimpleTransformer,
+    head: MaskPredictHead,
+    x: torch.Tensor,                                   # (B, Lx)
+    iterations: int = 4,
+    src_key_padding_mask: Optional[torch.Tensor] = None,
+) -> torch.Tensor:
+    """
+    Mask-Predict: iterations проходів голови замість target_len послідовних кроків.
+    iterations=1 — чисто паралельний прогноз. return: (B, target_len) long
+    """
+    model.eval()
+    head.eval()
+    iterations = max(1, int(iterations))
+    b, length = x.size(0), head.target_len
+
+    with torch.no_grad():
+        memory = model.encode(x, src_key_padding_mask)
+        tokens = torch.full((b, length), MASK_TOKEN, dtype=torch.long)
+        probs = torch.zeros((b, length))
+        for it in range(iterations):
+            logits = head(memory, tokens, src_key_padding_mask)
+            p, pred = logits.softmax(dim=-1).max(dim=-1)
+            masked = tokens == MASK_TOKEN
+            tokens = torch.where(masked, pred, tokens)
+            probs = torch.where(masked, p, probs)
+
+            n_mask = length * (iterations - 1 - it) // iterations
+            if n_mask == 0:
+                break
+            low = probs.topk(n_mask, dim=1, largest=False).indices
+            tokens.scatter_(1, low, MASK_TOKEN)
+    return tokens
+
+
+# ───────── Навчання ─────────
+class MaskPredictTrainer:
+    """
+    Навчання голови на (X, Y): у кожного семпла маскується випадкова кількість клітинок (1..L),
+    loss — CrossEntropy лише по замаскованих. Енкодер базової моделі не навчається.
+    """
+
+    def __init__(self, head: MaskPredictHead, lr: float = 1e-3, seed: Optional[int] = None):
+        self.head = head
+        self.optimizer = optim.Adam(self.head.parameters(), lr=lr)
+        self.criterion = nn.CrossEntropyLoss()
+        self.generator = torch.Generator()
+        if seed is not None:
+            self.generator.manual_seed(seed)
+        self.epochs_trained = 0
+
+    def set_lr(self, lr: float):
+        for group in self.optimizer.param_groups:
+            group["lr"] = lr
+
+    def _mask(self, y: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        b, length = y.shape
+        n = torch.randint(1, length + 1, (b, 1), generator=self.generator)
+        rank = torch.rand((b, length), generator=self.generator).argsort(dim=1).argsort(dim=1)
+        masked = rank < n
+        return y.masked_fill(masked, MASK_TOKEN), masked
+
+    def _step(self, memory: torch.Tensor, y: torch.Tensor, mem_mask: Optional[torch.Tensor]) -> float:
+        inp, masked = self._mask(y)
+        self.optimizer.zero_grad(set_to_none=True)
+        logits = self.head(memory, inp, mem_mask)
+        loss = self.criterion(logits[masked], y[masked])
+        loss.backward()
+        self.optimizer.step()
+        return float(loss.detach().item())
+
+    @staticmethod
+    def _encode(model: SimpleTransformer, x: torch.Tensor, mask: Optional[torch.Tensor]) -> torch.Tensor:
+        model.eval()
+        with torch.no_grad():
+            return model.encode(x, mask)
+
+    def fit(
+        self,
+        model: SimpleTransformer,
+        x: torch.Tensor,          # (B, Lx)
+        y: torch.Tensor,          # (B, 441)
+        epochs: int,
+        on_epoch: Optional[Callable[[float, Optional[float]], None]] = None,
+    ) -> List[float]:
+        """Багатоепохове навчання на одному батчі; memory енкодера рахується один раз."""
+        memory = self._encode(model, x, None)
+        self.head.train()
+        loss_hist = []
+        for _ in range(epochs):
+            loss = self._step(memory, y, None)
+            self.epochs_trained += 1
+            loss_hist.append(loss)
+            if on_epoch is not None:
+                on_epoch(loss, None)
+        return loss_hist
+
+    def fit_dataset(
+        self,
+        model: SimpleTransformer,
+        store: DatasetStore,
+        epochs: int,
+        batch_size: int = 32,
+        on_epoch: Optional[Callable[[float, Optional[float]], None]] = None,
+        bucket_width: int = 0,
+        indices: Optional[np.ndarray] = None,
+        seed: Optional[int] = None,
+    ) -> List[float]:
+        """Міні-батчі по розміченому корпусу (або підмножині indices); повертає середній loss по епохах."""
+        rng = np.random.default_rng(seed)
+        self.head.train()
+        loss_hist = []
+        for _ in range(epochs):
+            total, count = 0.0, 0
+            batches = store.iter_batches(
+                batch_size=batch_size,
+                shuffle=True,
+                seed=int(rng.integers(1 << 31)),
+                indices=indices,
+                bucket_width=bucket_width,
+            )
+            for x, y, mask in batches:
+                loss = self._step(self._encode(model, x, mask), y, mask)
+                total += loss * x.size(0)
+                count += x.size(0)
+            if count == 0:
+                raise ValueError("У сховищі датасетів немає семплів з Y")
+            self.epochs_trained += 1
+            loss_hist.append(total / count)
+            if on_epoch is not None:
+                on_epoch(total / count, None)
+        return loss_hist
+
+
+# ───────── Збереження ─────────
+def save_head(head: MaskPredictHead, path: Union[str, Path], meta: Optional[Dict[str, Any]] = None):
+    """meta — напр. base_version (версія знімка, на енкодері якого навчено), loss, epochs."""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    meta = {"hparams": head.hparams(), "saved_at": time.time(), **(meta or {})}
+    atomic_torch_save({"meta": meta, "state_dict": head.state_dict()}, path)
+
+
+def load_head(path: Union[str, Path]) -> Optional[Tuple[MaskPredictHead, Dict[str, Any]]]:
+    if not Path(path).exists():
+        return None
+    try:
+        ckpt = torch.load(str(path), map_location="cpu", weights_only=True)
+        head = MaskPredictHead(**ckpt["meta"]["hparams"])
+        head.load_state_dict(ckpt["state_dict"])
+        head.eval()
+        return head, ckpt["meta"]
+    except Exception:
+        return None
+
+
+# ───────── Порівняння з greedy ─────────
+def compare_decoding(
+    model: SimpleTransformer,
+    head: MaskPredictHead,
+    xs: List[torch.Tensor],
+    ys: List[Optional[np.ndarray]],
+    iterations: int = 4,
+) -> dict:
+    """
+    Greedy vs Mask-Predict на одних і тих самих X:
+      greedy_accuracy / nar_accuracy — частка клітинок, що збігаються з Y (лише семпли з Y)
+      agreement — частка клітинок, де обидва режими дали однаковий токен
+      greedy_ms / nar_ms — середній час декодингу одного семпла
+    """
+    length = head.target_len
+    greedy_s, nar_s = 0.0, 0.0
+    agree, total = 0, 0
+    g_correct, n_correct, labeled = 0, 0, 0
+
+    for x, y in zip(xs, ys):
+        x = x.view(1, -1)
+        t0 = time.perf_counter()
+        g = predict_tokens_greedy_batch(model, x, max_len=length)[0]
+        t1 = time.perf_counter()
+        n = mask_predict(model, head, x, iterations=iterations)[0]
+        t2 = time.perf_counter()
+        greedy_s += t1 - t0
+        nar_s += t2 - t1
+        agree += int((g == n).sum())
+        total += length
+        if y is not None:
+            target = torch.as_tensor(np.asarray(y, dtype=np.int64)[:length])
+            g_correct += int((g[: target.numel()] == target).sum())
+            n_correct += int((n[: target.numel()] == target).sum())
+            labeled += target.numel()
+
+    count = max(1, len(xs))
+    return {
+        "samples": len(xs),
+        "labeled_cells": labeled,
+        "iterations": iterations,
+        "greedy_accuracy": (g_correct / labeled) if labeled else None,
+        "nar_accuracy": (n_correct / labeled) if labeled else None,
+        "agreement": (agree / total) if total else None,
+        "greedy_ms": 1000.0 * greedy_s / count,
+        "nar_ms": 1000.0 * nar_s / count,
+    }
+
+
+def predict_batch_nar(
+    model: SimpleTransformer, head: MaskPredictHead, xs: List[torch.Tensor], iterations: int = 4
+) -> torch.Tensor:
+    """Список X різної довжини → (B, target_len) через pad_batch + Mask-Predict."""
+    x, mask = pad_batch(xs)
+    return mask_predict(model, head, x, iterations=iterations, src_key_padding_mask=mask)
@@ -0,0 +1,113 @@
+import math
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+import torch
+
+# ───────── Спільний кеш позиційних таблиць і каузальних масок ─────────
+# Один на процес для всіх екземплярів моделі (знімки, тренувальні копії, int8/compile-збірки).
+# Ключ — (вид, довжина, d_model, dtype, device); довжина округлюється вгору до кратної
+# _LENGTH_STEP, а коротші запити отримують зріз (view) готового тензора, тож X змінної довжини
+# не плодять записи. Розмір обмежений: найдавніше використаний запис витісняється (LRU).
+# Повернуті тензори спільні — лише для читання.
+_LENGTH_STEP = 64
+_MAX_ENTRIES = 16
+
+
+class _TensorCache:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[Hashable, torch.Tensor]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_build(self, key: Hashable, build) -> torch.Tensor:
+        with self._lock:
+            t = self._data.get(key)
+            if t is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return t
+        t = build()
+        with self._lock:
+            self.misses += 1
+            self._data[key] = t
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+        return t
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "bytes": sum(t.numel() * t.element_size() for t in self._data.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+_cache = _TensorCache(_MAX_ENTRIES)
+
+
+def _rounded(length: int) -> int:
+    return max(_LENGTH_STEP, -(-int(length) // _LENGTH_STEP) * _LENGTH_STEP)
+
+
+def _device(device: Optional[torch.device]) -> torch.device:
+    return torch.device(device) if device is not None else torch.device("cpu")
+
+
+def positional_table(
+    length: int,
+    d_model: int,
+    dtype: torch.dtype = torch.float32,
+    device: Optional[torch.device] = None,
+) -> torch.Tensor:
+    """Синусоїдальне позиційне кодування (1, length, d_model)."""
+    n = _rounded(length)
+    device = _device(device)
+
+    def build() -> torch.Tensor:
+        # явний cpu: таблиця рахується реально навіть всередині with torch.device("meta")
+        cpu = torch.device("cpu")
+        pe = torch.zeros(n, d_model, device=cpu)
+        position = torch.arange(0, n, dtype=torch.float32, device=cpu).unsqueeze(1)
+        div_term = torch.exp(
+            torch.arange(0, d_model, 2, dtype=torch.float32, device=cpu) * (-math.log(10000.0) / d_model)
+        )
+        pe[:, 0::2] = torch.sin(position * div_term)
+        pe[:, 1::2] = torch.cos(position * div_term)
+        return pe.unsqueeze(0).to(device=device, dtype=dtype)
+
+    return _cache.get_or_build(("pe", n, d_model, dtype, device), build)[:, :length]
+
+
+def causal_mask(
+    length: int,
+    dtype: torch.dtype = torch.float32,
+    device: Optional[torch.device] = None,
+) -> torch.Tensor:
+    """Каузальна маска (length, length): 0 на і під діагоналлю, -inf над нею (як generate_square_subsequent_mask)."""
+    n = _rounded(length)
+    device = _device(device)
+
+    def build() -> torch.Tensor:
+        return torch.triu(torch.full((n, n), float("-inf"), dtype=dtype, device=device), diagonal=1)
+
+    return _cache.get_or_build(("causal", n, dtype, device), build)[:length, :length]
+
+
+def cache_stats() -> dict:
+    return _cache.stats()
+
+
+def clear_cache():
+    _cache.clear()
@@ -0,0 +1,81 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import numpy as np
+import torch
+
+
+# ───────── Кеш передбачень (LRU + TTL) ─────────
+class PredictionCache:
+    """
+    Кеш результатів greedy-декодингу, ключ — hash(версія моделі + байти X float32).
+    Значення зберігаються як 441 байт uint8, тож пам'ять обмежена ≈ max_entries × 0.5 КБ.
+    max_entries <= 0 вимикає кеш.
+    """
+
+    def __init__(self, max_entries: int = 4096, ttl_s: float = 3600.0):
+        self.max_entries = int(max_entries)
+        self.ttl_s = float(ttl_s)
+        self._data: "OrderedDict[bytes, Tuple[float, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def make_key(version: int, x: torch.Tensor) -> bytes:
+        h = hashlib.blake2b(digest_size=16)
+        h.update(str(version).encode())
+        h.update(np.ascontiguousarray(x.detach().cpu().numpy(), dtype="<f4").tobytes())
+        return h.digest()
+
+    def get(self, key: bytes) -> Optional[torch.Tensor]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            raw = item[1]
+        return torch.from_numpy(np.frombuffer(raw, dtype=np.uint8).astype(np.int64))
+
+    def put(self, key: bytes, tokens: torch.Tensor):
+        if not self.enabled:
+            return
+        raw = tokens.detach().cpu().numpy().astype(np.uint8).tobytes()
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl_s, raw)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "ttl_s": self.ttl_s,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / total) if total else 0.0,
+            }
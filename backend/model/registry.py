@@ -0,0 +1,122 @@
+import copy
+import threading
+import time
+from typing import Callable, List, Optional
+
+from .inference_opt import inference_mode_of
+from .transformer_model import SimpleTransformer
+
+
+# ───────── Реєстр моделей: незмінні знімки + атомарна заміна ─────────
+class ModelSnapshot:
+    """
+    Незмінний знімок моделі для передбачень: eval-режим, без градієнтів.
+    Після публікації знімок ніхто не змінює — тренування йде на окремій копії.
+    infer_model — оптимізована для інференсу збірка (int8 / compile) або та сама model.
+    infer_mode — фактичний режим infer_model (compile без компілятора → "fp32").
+    """
+
+    __slots__ = ("model", "infer_model", "infer_mode", "version", "created_at")
+
+    def __init__(
+        self,
+        model: SimpleTransformer,
+        version: int,
+        build_inference: Optional[Callable[[SimpleTransformer], SimpleTransformer]] = None,
+    ):
+        model.eval()
+        for p in model.parameters():
+            p.requires_grad_(False)
+        self.model = model
+        self.infer_model = build_inference(model) if build_inference is not None else model
+        self.infer_mode = inference_mode_of(self.infer_model)
+        self.version = version
+        self.created_at = time.time()
+
+
+class ModelRegistry:
+    """
+    Тримає посилання на поточний ModelSnapshot.
+    Читачі (current) беруть посилання без блокувань — присвоєння атрибута атомарне,
+    тож вони бачать або старий, або новий знімок повністю, але ніколи не напівоновлені ваги.
+    Писачі (publish) серіалізуються між собою через лок.
+    build_inference(model) — збірка оптимізованої моделі для кожного нового знімка (до заміни).
+    Слухачі on_publish(before_swap=True) викликаються під локом писачів після persist, але до заміни:
+    для тих, хто має побачити нову версію раніше за читачів (напр. пул воркерів).
+    """
+
+    def __init__(self, build_inference: Optional[Callable[[SimpleTransformer], SimpleTransformer]] = None):
+        self._build_inference = build_inference
+        self._snapshot: Optional[ModelSnapshot] = None
+        self._write_lock = threading.Lock()
+        self._listeners: List[Callable[[ModelSnapshot], None]] = []
+        self._before_swap: List[Callable[[ModelSnapshot], None]] = []
+
+    @property
+    def version(self) -> int:
+        """Версія поточного знімка (0 — модель ще не завантажено)."""
+        snap = self._snapshot
+        return snap.version if snap is not None else 0
+
+    def current(self) -> Optional[ModelSnapshot]:
+        return self._snapshot
+
+    def get_or_create(self, factory: Callable[[], SimpleTransformer]) -> ModelSnapshot:
+        """Поточний знімок; якщо його ще нема — один раз створює через factory()."""
+        snap = self._snapshot
+        if snap is not None:
+            return snap
+        with self._write_lock:
+            if self._snapshot is None:
+                self._snapshot = ModelSnapshot(factory(), version=1, build_inference=self._build_inference)
+            snap = self._snapshot
+        return snap
+
+    def publish(
+        self,
+        model: SimpleTransformer,
+        expected_version: Optional[int] = None,
+        persist: Optional[Callable[[SimpleTransformer], None]] = None,
+    ) -> Optional[ModelSnapshot]:
+        """
+        Атомарно опублікувати нову модель (модель після цього не можна змінювати).
+        expected_version — compare-and-swap: якщо поточна версія інша (напр. був reset
+        під час навчання), публікація відхиляється і повертається None.
+        persist(model) виконується під локом писачів перед заміною (збереження чекпойнта),
+        щоб чекпойнт і опублікована модель не розходилися.
+        """
+        with self._write_lock:
+            if expected_version is not None and self.version != expected_version:
+                return None
+            if persist is not None:
+                persist(model)
+            snap = ModelSnapshot(model, version=self.version + 1, build_inference=self._build_inference)
+            _notify(self._before_swap, snap)
+            self._snapshot = snap
+
+        _notify(self._listeners, snap)
+        return snap
+
+    def on_publish(self, listener: Callable[[ModelSnapshot], None], before_swap: bool = False):
+        """
+        Підписка на публікацію нових версій (інвалідація кешу, перезавантаження воркерів).
+        before_swap=True — до того, як знімок стане видимим читачам через current()/version.
+        """
+        (self._before_swap if before_swap else self._listeners).append(listener)
+
+    @staticmethod
+    def training_copy(snap: ModelSnapshot) -> SimpleTransformer:
+        """Глибока копія знімка з увімкненими градієнтами — для тренера."""
+        model = copy.deepcopy(snap.model)
+        for p in model.parameters():
+            p.requires_grad_(True)
+        model.train()
+        return model
+
+
+def _notify(listeners: List[Callable[[ModelSnapshot], None]], snap: ModelSnapshot):
+    for listener in list(listeners):
+        try:
+            listener(snap)
+        except Exception:
+            pass
@@ -0,0 +1,299 @@
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.optim as optim
+
+from .dataset_store import DatasetStore
+from .transformer_model import SimpleTransformer, shift_right, VOCAB_SIZE
+
+EpochCallback = Callable[[float, Optional[float]], None]         # (train_loss, val_loss | None)
+CheckpointCallback = Callable[[Dict[str, torch.Tensor], float, int], None]  # (state_dict — валідний лише під час виклику, metric, epoch)
+
+
+# ───────── Критерій зупинки ─────────
+class EarlyStopping:
+    """
+    Відстежує найкраще значення метрики (val loss, або train loss без валідації):
+      - покращення — менше за best щонайменше на min_delta
+      - patience епох поспіль без покращення → should_stop (patience=0 — ніколи не зупиняє,
+        лише веде облік найкращої епохи)
+    """
+
+    def __init__(self, patience: int = 0, min_delta: float = 0.0):
+        self.patience = max(0, int(patience))
+        self.min_delta = max(0.0, float(min_delta))
+        self.best: Optional[float] = None
+        self.best_epoch = 0
+        self.bad_epochs = 0
+        self.stopped_epoch: Optional[int] = None
+
+    def update(self, value: float, epoch: int) -> bool:
+        """Облік епохи; True — метрика покращилась."""
+        if self.best is None or value < self.best - self.min_delta:
+            self.best, self.best_epoch, self.bad_epochs = value, epoch, 0
+            return True
+        self.bad_epochs += 1
+        if self.patience and self.bad_epochs >= self.patience:
+            self.stopped_epoch = epoch
+        return False
+
+    @property
+    def should_stop(self) -> bool:
+        return self.stopped_epoch is not None
+
+
+# ───────── Тренер зі збереженням стану оптимізатора ─────────
+class Trainer:
+    """
+    Живе між епохами і викликами API:
+      - один Adam на весь час життя моделі (моменти не губляться між кроками)
+      - CrossEntropyLoss і переміщення на device — один раз
+      - опційний ExponentialLR (lr_gamma < 1), крок — після кожної епохи
+      - опційний ReduceLROnPlateau (plateau_patience > 0) за метрикою епохи (val або train loss)
+      - рання зупинка, валідація на відкладеній частині корпусу і періодичне збереження
+        найкращих ваг (fit / fit_dataset з early_stopping)
+    Стан оптимізатора/шедулерів зберігається в чекпойнті (state_dict / load_state_dict).
+    """
+
+    def __init__(
+        self,
+        model: SimpleTransformer,
+        lr: float = 1e-3,
+        lr_gamma: float = 1.0,
+        vocab_size: int = VOCAB_SIZE,
+        plateau_patience: int = 0,
+        plateau_factor: float = 0.5,
+        min_lr: float = 1e-6,
+    ):
+        self.device = torch.device("cpu")
+        self.model = model.to(self.device)
+        self.vocab_size = vocab_size
+        self._options = {
+            "lr_gamma": lr_gamma,
+            "vocab_size": vocab_size,
+            "plateau_patience": plateau_patience,
+            "plateau_factor": plateau_factor,
+            "min_lr": min_lr,
+        }
+        self.base_lr = lr
+        self.optimizer = optim.Adam(self.model.parameters(), lr=lr)
+        self.criterion = nn.CrossEntropyLoss()
+        self.scheduler = (
+            optim.lr_scheduler.ExponentialLR(self.optimizer, gamma=lr_gamma) if lr_gamma < 1.0 else None
+        )
+        self.plateau = (
+            optim.lr_scheduler.ReduceLROnPlateau(
+                self.optimizer, mode="min", factor=plateau_factor, patience=plateau_patience, min_lr=min_lr
+            )
+            if plateau_patience > 0
+            else None
+        )
+        self.epochs_trained = 0
+
+    def options(self) -> Dict[str, Any]:
+        """Аргументи конструктора (крім моделі й lr) — щоб відтворити такий самий тренер в іншому процесі."""
+        return dict(self._options)
+
+    @property
+    def lr(self) -> float:
+        return float(self.optimizer.param_groups[0]["lr"])
+
+    def set_lr(self, lr: float):
+        """Новий базовий lr із запиту; якщо він не змінився — шедулер продовжує свій графік."""
+        if lr == self.base_lr:
+            return
+        self.base_lr = lr
+        for group in self.optimizer.param_groups:
+            group["lr"] = lr
+            group["initial_lr"] = lr
+        if self.scheduler is not None:
+            self.scheduler.base_lrs = [lr for _ in self.optimizer.param_groups]
+
+    def _step(
+        self, x: torch.Tensor, tgt_inp: torch.Tensor, y: torch.Tensor, mask: Optional[torch.Tensor] = None
+    ) -> float:
+        self.optimizer.zero_grad(set_to_none=True)
+        logits = self.model(x, tgt_inp, src_key_padding_mask=mask)  # (B, Ly, vocab)
+        loss = self.criterion(logits.reshape(-1, self.vocab_size), y.reshape(-1))
+        loss.backward()
+        self.optimizer.step()
+        return float(loss.detach().item())
+
+    def step(self, x: torch.Tensor, y: torch.Tensor) -> float:
+        """Один крок teacher forcing на (x, y) зі спільним оптимізатором."""
+        return self.fit(x, y, epochs=1)[0]
+
+    def _run_epochs(
+        self,
+        run_epoch: Callable[[], float],
+        epochs: int,
+        on_epoch: Optional[EpochCallback],
+        validate: Optional[Callable[[], float]],
+        early_stopping: Optional[EarlyStopping],
+        on_checkpoint: Optional[CheckpointCallback],
+        checkpoint_every: int,
+    ) -> List[float]:
+        """
+        Спільний цикл епох. Метрика епохи — validate() або train loss; за нею крокує
+        ReduceLROnPlateau і рахується рання зупинка. Кожні checkpoint_every епох (якщо з того часу
+        було покращення) ваги віддаються в on_checkpoint.
+        patience > 0 — найкращі ваги тримаються в пам'яті (копія на кожному покращенні): в on_checkpoint
+        ідуть саме вони, а після ранньої зупинки модель повертається до них.
+        patience = 0 — модель не відкочується, тож копії не робляться: в on_checkpoint ідуть поточні ваги
+        епохи збереження з її метрикою.
+        """
+        self.model.train()
+        loss_hist = []
+        keep_best = early_stopping is not None and early_stopping.patience > 0
+        best_state: Optional[Dict[str, torch.Tensor]] = None
+        unsaved = False
+        for epoch in range(1, epochs + 1):
+            loss = run_epoch()
+            if self.scheduler is not None:
+                self.scheduler.step()
+            self.epochs_trained += 1
+            loss_hist.append(loss)
+
+            val_loss = validate() if validate is not None else None
+            metric = val_loss if val_loss is not None else loss
+            if self.plateau is not None:
+                self.plateau.step(metric)
+            if on_epoch is not None:
+                on_epoch(loss, val_loss)
+
+            if early_stopping is None:
+                continue
+            if early_stopping.update(metric, epoch):
+                if keep_best:
+                    best_state = {k: v.detach().clone() for k, v in self.model.state_dict().items()}
+                unsaved = True
+            if on_checkpoint is not None and unsaved and checkpoint_every > 0 and epoch % checkpoint_every == 0 and epoch < epochs:
+                if keep_best:
+                    on_checkpoint(best_state, early_stopping.best, early_stopping.best_epoch)
+                else:
+                    on_checkpoint(self.model.state_dict(), metric, epoch)
+                unsaved = False
+            if early_stopping.should_stop:
+                break
+
+        if early_stopping is not None and early_stopping.should_stop and best_state is not None:
+            self.model.load_state_dict(best_state)
+        return loss_hist
+
+    def fit(
+        self,
+        x: torch.Tensor,      # (B, Lx) floats
+        y: torch.Tensor,      # (B, Ly) longs
+        epochs: int,
+        on_epoch: Optional[EpochCallback] = None,
+        early_stopping: Optional[EarlyStopping] = None,
+        on_checkpoint: Optional[CheckpointCallback] = None,
+        checkpoint_every: int = 0,
+    ) -> List[float]:
+        """
+        Багатоепоховий цикл на одному батчі: tgt_inp готується один раз,
+        model.train() — один раз. Повертає історію loss по епохах.
+        on_epoch(loss, None) викликається після кожної епохи (прогрес / скасування).
+        early_stopping — за train loss (на одному семплі відкладеної вибірки немає).
+        """
+        x = x.to(self.device)
+        y = y.to(self.device)
+        tgt_inp = shift_right(y)
+        return self._run_epochs(
+            lambda: self._step(x, tgt_inp, y),
+            epochs, on_epoch, None, early_stopping, on_checkpoint, checkpoint_every,
+        )
+
+    def evaluate(
+        self, store: DatasetStore, indices: np.ndarray, batch_size: int = 32, bucket_width: int = 0
+    ) -> Optional[float]:
+        """Середній loss (teacher forcing, без градієнтів) на підмножині сховища; None — якщо вона порожня."""
+        if len(indices) == 0:
+            return None
+        was_training = self.model.training
+        self.model.eval()
+        total, count = 0.0, 0
+        try:
+            with torch.no_grad():
+                batches = store.iter_batches(
+                    batch_size=batch_size, shuffle=False, indices=indices, bucket_width=bucket_width
+                )
+                for x, y, mask in batches:
+                    x = x.to(self.device)
+                    y = y.to(self.device)
+                    logits = self.model(x, shift_right(y), src_key_padding_mask=mask)
+                    loss = self.criterion(logits.reshape(-1, self.vocab_size), y.reshape(-1))
+                    total += float(loss.item()) * x.size(0)
+                    count += x.size(0)
+        finally:
+            self.model.train(was_training)
+        return (total / count) if count else None
+
+    def fit_dataset(
+        self,
+        store: DatasetStore,
+        epochs: int,
+        batch_size: int = 32,
+        on_epoch: Optional[EpochCallback] = None,
+        seed: Optional[int] = None,
+        val_fraction: float = 0.0,
+        early_stopping: Optional[EarlyStopping] = None,
+        on_checkpoint: Optional[CheckpointCallback] = None,
+        checkpoint_every: int = 0,
+        bucket_width: int = 0,
+    ) -> List[float]:
+        """
+        Навчання міні-батчами по накопиченому корпусу (лише семпли з Y).
+        Кожна епоха — новий перемішаний прохід store.iter_batches() по train-частині;
+        bucket_width > 0 — X близької довжини батчуються разом з маскою доповнення.
+        val_fraction > 0 — частина семплів відкладається (store.split) і після кожної епохи
+        рахується val loss: за ним працюють early_stopping і ReduceLROnPlateau.
+        Повертає історію середнього train loss по епохах (зважено за розміром батчу).
+        """
+        rng = np.random.default_rng(seed)
+        train_idx, val_idx = store.split(val_fraction)
+        if len(train_idx) == 0:
+            raise ValueError("У сховищі датасетів немає семплів з Y")
+
+        def run_epoch() -> float:
+            total, count = 0.0, 0
+            batches = store.iter_batches(
+                batch_size=batch_size,
+                shuffle=True,
+                seed=int(rng.integers(1 << 31)),
+                indices=train_idx,
+                bucket_width=bucket_width,
+            )
+            for x, y, mask in batches:
+                x = x.to(self.device)
+                y = y.to(self.device)
+                loss = self._step(x, shift_right(y), y, mask)
+                total += loss * x.size(0)
+                count += x.size(0)
+            return total / count
+
+        validate = (lambda: self.evaluate(store, val_idx, batch_size, bucket_width)) if len(val_idx) else None
+        return self._run_epochs(
+            run_epoch, epochs, on_epoch, validate, early_stopping, on_checkpoint, checkpoint_every,
+        )
+
+    # ───── Стан для чекпойнта ─────
+    def state_dict(self) -> Dict[str, Any]:
+        return {
+            "optimizer": self.optimizer.state_dict(),
+            "scheduler": self.scheduler.state_dict() if self.scheduler is not None else None,
+            "plateau": self.plateau.state_dict() if self.plateau is not None else None,
+            "base_lr": self.base_lr,
+            "epochs_trained": self.epochs_trained,
+        }
+
+    def load_state_dict(self, state: Dict[str, Any]):
+        self.optimizer.load_state_dict(state["optimizer"])
+        if self.scheduler is not None and state.get("scheduler") is not None:
+            self.scheduler.load_state_dict(state["scheduler"])
+        if self.plateau is not None and state.get("plateau") is not None:
+            self.plateau.load_state_dict(state["plateau"])
+        self.base_lr = state.get("base_lr", self.base_lr)
+        self.epochs_trained = int(state.get("epochs_trained", 0))
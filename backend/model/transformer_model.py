@@ -1,9 +1,13 @@
-from typing import Optional
+import time
+from typing import List, Optional, Sequence, Tuple
 
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 import torch.optim as optim
 
+from .positional import causal_mask, positional_table
+
 # ───────── Константи токенів ─────────
 # 0,1,2 — класи з Y; 3 — спецтокен (start)
 VOCAB_SIZE = 4
@@ -12,19 +16,29 @@ START_TOKEN = 3
 
 # ───────── Positional Encoding ─────────
 class PositionalEncoding(nn.Module):
+    """
+    Синусоїдальне кодування без власного буфера: таблиця береться зі спільного кешу
+    model/positional.py (одна на процес для всіх моделей, під потрібну довжину/dtype/device).
+    """
+
     def __init__(self, d_model: int, max_len: int = 6000):
         super().__init__()
-        pe = torch.zeros(max_len, d_model)
-        position = torch.arange(0, max_len, dtype=torch.float32).unsqueeze(1)
-        div_term = torch.exp(torch.arange(0, d_model, 2, dtype=torch.float32) * (-torch.log(torch.tensor(10000.0)) / d_model))
-        pe[:, 0::2] = torch.sin(position * div_term)
-        pe[:, 1::2] = torch.cos(position * div_term)
-        pe = pe.unsqueeze(0)  # (1, max_len, d_model)
-        self.register_buffer("pe", pe)
+        self.d_model = d_model
+        self.max_len = max_len
+
+    def table(self, length: int, dtype: torch.dtype = torch.float32, device=None) -> torch.Tensor:
+        """(1, length, d_model)"""
+        if length > self.max_len:
+            raise ValueError(f"Довжина {length} перевищує max_len={self.max_len}")
+        return positional_table(length, self.d_model, dtype, device)
 
     def forward(self, x: torch.Tensor) -> torch.Tensor:
-        x = x + self.pe[:, : x.size(1)]
-        return x
+        return x + self.table(x.size(1), x.dtype, x.device)
+
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        # старі чекпойнти містять буфер pe (6000×d_model) — він більше не потрібен
+        state_dict.pop(prefix + "pe", None)
+        super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
 
 
 # ───────── Модель ─────────
@@ -41,6 +55,10 @@ class SimpleTransformer(nn.Module):
         super().__init__()
         self.input_seq_len = input_seq_len
         self.target_seq_len = target_seq_len
+        self.d_model = d_model
+        self.nhead = nhead
+        self.num_layers = num_layers
+        self.vocab_size = vocab_size
 
         self.input_embed = nn.Linear(1, d_model)
         self.pos_encoder = PositionalEncoding(d_model)
@@ -58,10 +76,28 @@ class SimpleTransformer(nn.Module):
 
         self.fc_out = nn.Linear(d_model, vocab_size)
 
-    def forward(self, src: torch.Tensor, tgt: torch.Tensor) -> torch.Tensor:
+    def hparams(self) -> dict:
+        """Аргументи конструктора — зберігаються в чекпойнті, щоб відновити ту саму форму моделі."""
+        return {
+            "input_seq_len": self.input_seq_len,
+            "target_seq_len": self.target_seq_len,
+            "d_model": self.d_model,
+            "nhead": self.nhead,
+            "num_layers": self.num_layers,
+            "vocab_size": self.vocab_size,
+        }
+
+    def forward(
+        self,
+        src: torch.Tensor,
+        tgt: torch.Tensor,
+        src_key_padding_mask: Optional[torch.Tensor] = None,
+    ) -> torch.Tensor:
         """
         src: (B, Ls) floats
         tgt: (B, Lt) long (tokens)
+        src_key_padding_mask: (B, Ls) bool, True — доповнена позиція X (ігнорується енкодером
+            і крос-увагою декодера); None — усі X батчу однакової довжини
         return: (B, Lt, vocab)
         """
         # SRC
@@ -75,17 +111,177 @@ class SimpleTransformer(nn.Module):
         t = self.pos_decoder(t)      # (B, Lt, d)
         t = t.permute(1, 0, 2)       # (Lt, B, d)
 
-        # casual mask для автогенерації
-        device = tgt.device
-        tgt_mask = nn.Transformer.generate_square_subsequent_mask(t.size(0)).to(device)
+        # casual mask для автогенерації — зі спільного кешу, без алокації на кожен виклик
+        tgt_mask = causal_mask(t.size(0), t.dtype, t.device)
 
-        out = self.transformer(s, t, tgt_mask=tgt_mask)  # (Lt, B, d)
+        out = self.transformer(
+            s,
+            t,
+            tgt_mask=tgt_mask,
+            tgt_is_causal=True,
+            src_key_padding_mask=src_key_padding_mask,
+            memory_key_padding_mask=src_key_padding_mask,
+        )  # (Lt, B, d)
         out = out.permute(1, 0, 2)  # (B, Lt, d)
         logits = self.fc_out(out)   # (B, Lt, vocab)
         return logits
 
+    # ───── Інкрементальний інференс ─────
+    def encode(self, src: torch.Tensor, src_key_padding_mask: Optional[torch.Tensor] = None) -> torch.Tensor:
+        """
+        src: (B, Ls) floats
+        src_key_padding_mask: (B, Ls) bool, True — доповнена позиція
+        return: memory (Ls, B, d) — рахується один раз на весь декодинг
+        """
+        s = self.input_embed(src.unsqueeze(-1))  # (B, Ls, d)
+        s = self.pos_encoder(s)
+        s = s.permute(1, 0, 2)                   # (Ls, B, d)
+        return self.transformer.encoder(s, src_key_padding_mask=src_key_padding_mask)
+
+    def init_decode_cache(
+        self,
+        memory: torch.Tensor,
+        max_len: int,
+        memory_key_padding_mask: Optional[torch.Tensor] = None,
+    ) -> "DecodeCache":
+        """
+        Готує кеш для decode_step:
+          - K/V крос-уваги кожного шару декодера з memory (один раз)
+          - маска крос-уваги (доповнені позиції memory не враховуються)
+          - порожні буфери K/V self-attention на max_len позицій
+        """
+        mem = memory.permute(1, 0, 2)  # (B, Ls, d)
+        b = mem.size(0)
+        d = self.d_model
+        head_dim = d // self.nhead
+
+        mem_kv = []
+        self_k = []
+        self_v = []
+        for layer in self.transformer.decoder.layers:
+            ca = layer.multihead_attn
+            k, v = F.linear(mem, ca.in_proj_weight[d:], ca.in_proj_bias[d:]).chunk(2, dim=-1)
+            mem_kv.append((_split_heads(k, self.nhead), _split_heads(v, self.nhead)))
+            self_k.append(mem.new_empty((b, self.nhead, max_len, head_dim)))
+            self_v.append(mem.new_empty((b, self.nhead, max_len, head_dim)))
+        # SDPA: bool-маска True — позицію враховувати; (B, 1, 1, Ls) транслюється на голови/запити
+        mem_mask = None
+        if memory_key_padding_mask is not None:
+            mem_mask = (~memory_key_padding_mask.to(torch.bool))[:, None, None, :]
+        pos = self.pos_decoder.table(max_len, mem.dtype, mem.device)
+        return DecodeCache(mem_kv, self_k, self_v, mem_mask, pos)
+
+    def decode_step(self, tokens: torch.Tensor, cache: "DecodeCache") -> torch.Tensor:
+        """
+        Один крок декодера лише для найновішого токена.
+        tokens: (B,) long — токени на позиції cache.length
+        return: logits (B, vocab) для наступної позиції
+        Еквівалентно forward(...)[:, -1] (post-norm шари nn.TransformerDecoderLayer).
+        """
+        pos = cache.length
+        d = self.d_model
+
+        x = self.output_embed(tokens).unsqueeze(1)      # (B, 1, d)
+        x = x + cache.pos[:, pos : pos + 1]
+
+        for i, layer in enumerate(self.transformer.decoder.layers):
+            # self-attention: новий токен бачить усі попередні (casual mask не потрібна)
+            sa = layer.self_attn
+            q, k, v = F.linear(x, sa.in_proj_weight, sa.in_proj_bias).chunk(3, dim=-1)
+            cache.self_k[i][:, :, pos : pos + 1] = _split_heads(k, self.nhead)
+            cache.self_v[i][:, :, pos : pos + 1] = _split_heads(v, self.nhead)
+            a = _attend(
+                sa,
+                _split_heads(q, self.nhead),
+                cache.self_k[i][:, :, : pos + 1],
+                cache.self_v[i][:, :, : pos + 1],
+            )
+            x = layer.norm1(x + a)
+
+            # cross-attention до закешованих K/V енкодера
+            ca = layer.multihead_attn
+            q = F.linear(x, ca.in_proj_weight[:d], ca.in_proj_bias[:d])
+            mem_k, mem_v = cache.mem_kv[i]
+            x = layer.norm2(x + _attend(ca, _split_heads(q, self.nhead), mem_k, mem_v, cache.mem_mask))
+
+            # feed-forward
+            x = layer.norm3(x + layer.linear2(layer.dropout(layer.activation(layer.linear1(x)))))
+
+        if self.transformer.decoder.norm is not None:
+            x = self.transformer.decoder.norm(x)
+
+        cache.length += 1
+        return self.fc_out(x[:, 0])  # (B, vocab)
+
+
+class DecodeCache:
+    """
+    Стан інкрементального декодування одного батчу:
+      mem_kv — [(K, V)] крос-уваги по шарах, (B, H, Ls, hd)
+      self_k / self_v — накопичені K/V self-attention по шарах, (B, H, max_len, hd)
+      mem_mask — (B, 1, 1, Ls) bool, True — реальна позиція X; None — без доповнення
+      pos — позиційна таблиця декодера (1, max_len, d) зі спільного кешу
+      length — скільки позицій уже оброблено
+    """
+
+    def __init__(self, mem_kv, self_k, self_v, mem_mask: Optional[torch.Tensor] = None, pos: Optional[torch.Tensor] = None):
+        self.mem_kv = mem_kv
+        self.self_k = self_k
+        self.self_v = self_v
+        self.mem_mask = mem_mask
+        self.pos = pos
+        self.length = 0
+
+
+def _split_heads(x: torch.Tensor, nhead: int) -> torch.Tensor:
+    """(B, L, d) → (B, H, L, d/H)"""
+    b, l, d = x.shape
+    return x.reshape(b, l, nhead, d // nhead).transpose(1, 2)
+
+
+def _attend(
+    attn: nn.MultiheadAttention,
+    q: torch.Tensor,
+    k: torch.Tensor,
+    v: torch.Tensor,
+    mask: Optional[torch.Tensor] = None,
+) -> torch.Tensor:
+    """Scaled dot-product attention по головах + out_proj. q: (B, H, Lq, hd) → (B, Lq, d)"""
+    out = F.scaled_dot_product_attention(q, k, v, attn_mask=mask)
+    b, h, lq, hd = out.shape
+    out = out.transpose(1, 2).reshape(b, lq, h * hd)
+    return attn.out_proj(out)
+
+
+# ───────── X змінної довжини ─────────
+def padding_mask(lengths: Sequence[int], max_len: Optional[int] = None) -> torch.Tensor:
+    """Довжини семплів → (B, max_len) bool, True — доповнена позиція."""
+    lengths_t = torch.as_tensor(list(lengths), dtype=torch.long)
+    max_len = int(lengths_t.max()) if max_len is None else max_len
+    return torch.arange(max_len)[None, :] >= lengths_t[:, None]
+
+
+def pad_batch(xs: List[torch.Tensor]) -> Tuple[torch.Tensor, Optional[torch.Tensor]]:
+    """
+    Список X (Lx_i,) → (B, max Lx) з нулями в хвості і маску доповнення.
+    Якщо всі довжини однакові — маска None (швидкий шлях без маскування).
+    """
+    lengths = [int(x.shape[-1]) for x in xs]
+    if len(set(lengths)) == 1:
+        return torch.stack(xs), None
+    out = torch.zeros((len(xs), max(lengths)), dtype=xs[0].dtype)
+    for i, x in enumerate(xs):
+        out[i, : lengths[i]] = x
+    return out, padding_mask(lengths)
+
 
 # ───────── One-step train ─────────
+def shift_right(y: torch.Tensor, start_token: int = START_TOKEN) -> torch.Tensor:
+    """Вхід декодера для teacher forcing: [START] + y[:-1]. y: (B, Ly) → (B, Ly)"""
+    start_col = torch.full((y.size(0), 1), start_token, dtype=torch.long, device=y.device)
+    return torch.cat([start_col, y[:, :-1]], dim=1)
+
+
 def train_once(
     model: SimpleTransformer,
     x: torch.Tensor,      # (B, Lx) floats
@@ -97,6 +293,8 @@ def train_once(
     Один прохід з teacher forcing:
       tgt_inp = [START] + y[:-1]
       loss = CrossEntropy(logits, y)
+    Оптимізатор створюється заново на кожен виклик; для багатоепохового
+    навчання зі збереженням стану Adam — model/trainer.py (Trainer).
     """
     device = torch.device("cpu")
     model.to(device)
@@ -104,8 +302,7 @@ def train_once(
     y = y.to(device)
 
     # готуємо tgt_inp
-    start_col = torch.full((y.size(0), 1), START_TOKEN, dtype=torch.long, device=device)
-    tgt_inp = torch.cat([start_col, y[:, :-1]], dim=1)  # (B, Ly)
+    tgt_inp = shift_right(y)  # (B, Ly)
 
     model.train()
     optimizer = optim.Adam(model.parameters(), lr=lr)
@@ -126,15 +323,21 @@ def predict_tokens_greedy(
     x: torch.Tensor,             # (B=1, Lx)
     max_len: int,
     start_token: int = START_TOKEN,
+    use_cache: bool = True,
 ) -> torch.Tensor:
     """
     Генерує послідовність токенів довжини ≤ max_len з greedy-стратегією.
+    use_cache=True — енкодер рахується один раз, декодер інкрементально (K/V-кеш);
+    use_cache=False — еталонний повний forward на кожному кроці (для перевірки).
     """
     device = torch.device("cpu")
     model.eval()
     model.to(device)
     x = x.to(device)
 
+    if use_cache:
+        return predict_tokens_greedy_batch(model, x, max_len, start_token)[0]
+
     tgt = torch.full((1, 1), start_token, dtype=torch.long, device=device)  # (1,1)
     out_tokens = []
 
@@ -146,3 +349,44 @@ def predict_tokens_greedy(
             out_tokens.append(int(next_token.item()))
 
     return torch.tensor(out_tokens, dtype=torch.long)
+
+
+def predict_tokens_greedy_batch(
+    model: SimpleTransformer,
+    x: torch.Tensor,             # (B, Lx)
+    max_len: int,
+    start_token: int = START_TOKEN,
+    timings: Optional[dict] = None,
+    src_key_padding_mask: Optional[torch.Tensor] = None,
+) -> torch.Tensor:
+    """
+    Батчевий greedy-декодинг з кешем енкодера та K/V декодера.
+    Усі семпли батчу декодуються одночасно за max_len кроків.
+    src_key_padding_mask — (B, Lx) bool для батчу X різної довжини (див. pad_batch).
+    timings — якщо передано, заповнюється тривалістю етапів: {"encode": с, "decode": с}.
+    return: (B, max_len)
+    """
+    device = torch.device("cpu")
+    model.eval()
+    model.to(device)
+    x = x.to(device)
+
+    b = x.size(0)
+    out = torch.empty((b, max_len), dtype=torch.long, device=x.device)
+
+    with torch.no_grad():
+        t0 = time.perf_counter()
+        memory = model.encode(x, src_key_padding_mask)
+        cache = model.init_decode_cache(memory, max_len, src_key_padding_mask)
+        t1 = time.perf_counter()
+        tokens = torch.full((b,), start_token, dtype=torch.long, device=x.device)
+        for t in range(max_len):
+            logits = model.decode_step(tokens, cache)  # (B, vocab)
+            tokens = logits.argmax(dim=-1)
+            out[:, t] = tokens
+
+    if timings is not None:
+        timings["encode"] = t1 - t0
+        timings["decode"] = time.perf_counter() - t1
+
+    return out
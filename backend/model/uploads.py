@@ -0,0 +1,75 @@
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
+
+# ───────── Потокове збереження завантажень ─────────
+CHUNK_SIZE = 1 << 20  # 1 МіБ
+
+
+class SpooledUpload:
+    """
+    Завантаження, записане на диск:
+      path — файл (content-addressed: {sha256}{ext}, якщо keep=True)
+      sha256 / size — рахуються під час запису
+      duplicate — такий самий вміст уже був збережений раніше
+    """
+
+    def __init__(self, path: Path, filename: Optional[str], sha256: str, size: int, duplicate: bool):
+        self.path = path
+        self.filename = filename
+        self.sha256 = sha256
+        self.size = size
+        self.duplicate = duplicate
+
+
+def _write_chunk(out, hasher, chunk: bytes):
+    hasher.update(chunk)
+    out.write(chunk)
+
+
+async def spool_upload(
+    file: UploadFile,
+    dest_dir: Path,
+    keep: bool = True,
+    chunk_size: int = CHUNK_SIZE,
+) -> SpooledUpload:
+    """
+    Читає UploadFile чанками і пише на диск поза event loop, рахуючи sha256 по ходу.
+    Пам'ять — O(chunk_size) незалежно від розміру файлу.
+    keep=True: файл перейменовується в {sha256}{ext}; якщо такий уже є — дубль видаляється,
+    повертається наявний шлях з duplicate=True.
+    keep=False: тимчасовий файл (прибирає викликач).
+    """
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    ext = Path(file.filename or "").suffix.lower() or ".bin"
+    fd, tmp = tempfile.mkstemp(dir=dest_dir, suffix=ext + ".part")
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                await run_in_threadpool(_write_chunk, out, hasher, chunk)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+    digest = hasher.hexdigest()
+    if not keep:
+        return SpooledUpload(Path(tmp), file.filename, digest, size, duplicate=False)
+
+    final = dest_dir / f"{digest}{ext}"
+    if final.exists():
+        os.remove(tmp)
+        os.utime(final)  # повторно використаний — retention прибирає найдавніше використані
+        return SpooledUpload(final, file.filename, digest, size, duplicate=True)
+    os.replace(tmp, final)
+    return SpooledUpload(final, file.filename, digest, size, duplicate=False)
@@ -0,0 +1,58 @@
+import warnings
+from typing import Optional, Tuple
+
+import numpy as np
+import torch
+
+# ───────── Бінарний формат X/Y (application/octet-stream) ─────────
+# Альтернатива JSON для /api/predict/binary і /api/train/binary:
+#   X — сирі little-endian float32 (4 байти на ознаку), без заголовка
+#   Y — сирі uint8 токени (до 441), дописані одразу після X (лише для train)
+#   відповідь predict — 441 байт uint8 (рядки матриці 21x21 підряд), форма — у заголовку X-Shape
+# Тіло не розбирається поелементно: np.frombuffer дає view на байти запиту, torch.from_numpy —
+# view на той самий буфер (без копій і без валідації кожного числа, як у List[float]).
+CONTENT_TYPE = "application/octet-stream"
+_F32 = np.dtype("<f4")
+
+
+class WireFormatError(ValueError):
+    """Тіло запиту не відповідає бінарному формату."""
+
+
+def readonly_tensor(arr: np.ndarray) -> torch.Tensor:
+    """Тензор-view на масив лише для читання (np.frombuffer над bytes) без копії і без UserWarning torch."""
+    # bytes незмінні → масив лише для читання; тензор теж лише читається (декодинг, кеш, навчання)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        return torch.from_numpy(arr)
+
+
+def decode_x(body: bytes, x_len: Optional[int] = None) -> torch.Tensor:
+    """Перші x_len float32 (усе тіло, якщо x_len=None) → (Lx,) float32."""
+    n_bytes = len(body) if x_len is None else x_len * _F32.itemsize
+    if n_bytes <= 0 or n_bytes % _F32.itemsize or n_bytes > len(body):
+        raise WireFormatError(f"Очікувалось X як float32: {len(body)} байт не ділиться на 4 або замало даних")
+    x = np.frombuffer(body, dtype=_F32, count=n_bytes // _F32.itemsize)
+    if not np.isfinite(x).all():
+        raise WireFormatError("X містить NaN або нескінченність")
+    return readonly_tensor(x)
+
+
+def decode_xy(body: bytes, x_len: Optional[int], vocab_size: int) -> Tuple[torch.Tensor, Optional[torch.Tensor]]:
+    """
+    X (x_len float32) + необов'язковий хвіст Y (uint8). x_len=None — усе тіло є X, Y немає.
+    return: (Lx,) float32 — view на тіло; (Ly,) long або None
+    """
+    x = decode_x(body, x_len)
+    tail = memoryview(body)[x.numel() * _F32.itemsize :]
+    if not len(tail):
+        return x, None
+    y = np.frombuffer(tail, dtype=np.uint8)
+    if int(y.max()) >= vocab_size:
+        raise WireFormatError(f"Токени Y мають бути в діапазоні 0..{vocab_size - 1}")
+    return x, torch.from_numpy(y.astype(np.int64))
+
+
+def encode_tokens(tokens: torch.Tensor) -> bytes:
+    """(…) long → uint8 байти в тому самому порядку (C-order)."""
+    return tokens.to(torch.uint8).contiguous().numpy().tobytes()
@@ -0,0 +1,251 @@
+import multiprocessing as mp
+import threading
+import time
+from queue import Queue
+from typing import List, Optional
+
+import numpy as np
+import torch
+
+# ───────── Пул процесів для інференсу ─────────
+# Кожен воркер — окремий інтерпретатор із власною копією моделі з CheckpointStore.
+# IPC — multiprocessing.Pipe; X і результат передаються сирими байтами (float32 / uint8).
+#   → ("predict", x_bytes, (B, Lx), lengths | None)   ← ("ok", tokens_bytes, (B, Lt)) | ("error", message)
+#     lengths — справжні довжини X у доповненому батчі (маска будується у воркері)
+#   → ("reload",)                     ← ("reloaded", checkpoint_version)
+#   → ("ping",)                       ← ("pong", checkpoint_version)
+#   → ("stop",)
+
+
+def _load_for_inference(checkpoint_dir: str, inference_mode: str):
+    from .checkpoints import CheckpointStore
+    from .inference_opt import build_inference_model
+
+    store = CheckpointStore(checkpoint_dir)
+    loaded = store.load()
+    if loaded is None:
+        raise RuntimeError(f"У {checkpoint_dir} немає чекпойнтів для воркера інференсу")
+    model, meta = loaded
+    model.eval()
+    return build_inference_model(model, inference_mode), meta.get("version")
+
+
+def _worker_main(conn, checkpoint_dir: str, inference_mode: str, threads: int, warmup: bool = False):
+    """Точка входу дочірнього процесу. warmup — прогнати декодинг до відповіді "ready"."""
+    from .inference_opt import warm_up
+    from .transformer_model import padding_mask, predict_tokens_greedy_batch, START_TOKEN
+    from .wire import readonly_tensor
+
+    torch.set_num_threads(max(1, threads))
+    model, version = _load_for_inference(checkpoint_dir, inference_mode)
+    if warmup:
+        warm_up(model)
+    conn.send(("ready", version))
+
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            break
+        op = msg[0]
+        try:
+            if op == "predict":
+                _, raw, shape, lengths = msg
+                x = readonly_tensor(np.frombuffer(raw, dtype="<f4").reshape(shape))
+                mask = padding_mask(lengths, shape[1]) if lengths is not None else None
+                tokens = predict_tokens_greedy_batch(
+                    model, x, max_len=model.target_seq_len, start_token=START_TOKEN, src_key_padding_mask=mask
+                )
+                conn.send(("ok", tokens.numpy().astype(np.uint8).tobytes(), tuple(tokens.shape)))
+            elif op == "reload":
+                model, version = _load_for_inference(checkpoint_dir, inference_mode)
+                conn.send(("reloaded", version))
+            elif op == "ping":
+                conn.send(("pong", version))
+            elif op == "stop":
+                break
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+class _WorkerHandle:
+    """Процес-воркер і його кінець Pipe. lock — ексклюзивне використання (запит / health-check)."""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.process = None
+        self.conn = None
+        self.version = None       # версія чекпойнта, завантажена воркером
+        self.generation = -1      # покоління публікацій, яке бачив воркер
+        self.restarts = -1
+        self.lock = threading.Lock()
+
+
+class InferenceWorkerPool:
+    """
+    Пул процесів інференсу:
+      - run_batch(x) бере вільний воркер, шле батч і чекає відповіді (timeout → перезапуск воркера)
+      - reload() позначає нове покоління моделі; кожен воркер перезавантажує чекпойнт
+        перед наступним запитом (або фоновим монітором, якщо простоює)
+      - монітор перевіряє, чи живі процеси, і перезапускає впалі
+    """
+
+    def __init__(
+        self,
+        n_workers: int,
+        checkpoint_dir: str,
+        inference_mode: str = "fp32",
+        threads_per_worker: int = 1,
+        timeout_s: float = 120.0,
+        health_interval_s: float = 5.0,
+        warmup: bool = False,
+    ):
+        self.n_workers = max(1, int(n_workers))
+        self.checkpoint_dir = str(checkpoint_dir)
+        self.inference_mode = inference_mode
+        self.threads_per_worker = threads_per_worker
+        self.timeout_s = timeout_s
+        self.health_interval_s = health_interval_s
+        self.warmup = warmup
+        self._ctx = mp.get_context("spawn")
+        self._handles: List[_WorkerHandle] = []
+        self._idle: "Queue[_WorkerHandle]" = Queue()
+        self._generation = 0
+        self._started = False
+        self._stopping = threading.Event()
+
+    # ───── Життєвий цикл ─────
+    def start(self):
+        if self._started:
+            return
+        for i in range(self.n_workers):
+            handle = _WorkerHandle(i)
+            self._spawn(handle)
+            self._handles.append(handle)
+            self._idle.put(handle)
+        self._started = True
+        threading.Thread(target=self._monitor, name="inference-pool-monitor", daemon=True).start()
+
+    def stop(self):
+        self._stopping.set()
+        for h in self._handles:
+            try:
+                h.conn.send(("stop",))
+            except Exception:
+                pass
+            h.process.join(timeout=5)
+            if h.process.is_alive():
+                h.process.kill()
+
+    def _spawn(self, handle: _WorkerHandle):
+        if handle.process is not None and handle.process.is_alive():
+            handle.process.kill()
+            handle.process.join(timeout=5)
+        parent, child = self._ctx.Pipe()
+        proc = self._ctx.Process(
+            target=_worker_main,
+            args=(child, self.checkpoint_dir, self.inference_mode, self.threads_per_worker, self.warmup),
+            name=f"inference-worker-{handle.index}",
+            daemon=True,
+        )
+        proc.start()
+        child.close()
+        handle.process, handle.conn = proc, parent
+        handle.restarts += 1
+        generation = self._generation
+        status, version = self._recv(handle, expect="ready")
+        handle.version, handle.generation = version, generation
+
+    def _recv(self, handle: _WorkerHandle, expect: str):
+        if not handle.conn.poll(self.timeout_s):
+            raise TimeoutError(f"Воркер {handle.index} не відповів за {self.timeout_s} с")
+        reply = handle.conn.recv()
+        if reply[0] == "error":
+            raise RuntimeError(reply[1])
+        if reply[0] != expect:
+            raise RuntimeError(f"Воркер {handle.index}: неочікувана відповідь {reply[0]}")
+        return reply
+
+    def _sync(self, handle: _WorkerHandle):
+        """Перезавантажити модель воркера, якщо з'явилось нове покоління. Під handle.lock."""
+        generation = self._generation
+        if handle.generation != generation:
+            handle.conn.send(("reload",))
+            _, handle.version = self._recv(handle, expect="reloaded")
+            handle.generation = generation
+
+    # ───── Запити ─────
+    def reload(self):
+        """Нова модель опублікована (чекпойнт уже на диску) — воркери перезавантажаться."""
+        self._generation += 1
+
+    def run_batch(self, x: torch.Tensor, src_key_padding_mask: Optional[torch.Tensor] = None) -> torch.Tensor:
+        """
+        x: (B, Lx) float32 → (B, Lt) long. Один повтор на іншому воркері, якщо цей впав.
+        src_key_padding_mask — (B, Lx) bool для доповненого батчу; воркеру передаються лише довжини.
+        """
+        raw = np.ascontiguousarray(x.numpy(), dtype="<f4").tobytes()
+        lengths = None
+        if src_key_padding_mask is not None:
+            lengths = (~src_key_padding_mask).sum(dim=1).tolist()
+        last_error: Optional[Exception] = None
+        for _ in range(2):
+            handle = self._idle.get()
+            try:
+                with handle.lock:
+                    try:
+                        self._sync(handle)
+                        handle.conn.send(("predict", raw, tuple(x.shape), lengths))
+                        _, tokens, shape = self._recv(handle, expect="ok")
+                        return torch.from_numpy(np.frombuffer(tokens, dtype=np.uint8).reshape(shape).astype(np.int64))
+                    except (EOFError, OSError, TimeoutError, BrokenPipeError) as e:
+                        last_error = e
+                        self._spawn(handle)
+            finally:
+                self._idle.put(handle)
+        raise RuntimeError(f"Пул інференсу: запит не виконано ({last_error})")
+
+    # ───── Health-check ─────
+    def _monitor(self):
+        while not self._stopping.wait(self.health_interval_s):
+            for handle in self._handles:
+                if not handle.lock.acquire(blocking=False):
+                    continue  # зайнятий запитом — отже живий
+                try:
+                    if not handle.process.is_alive():
+                        self._spawn(handle)
+                    else:
+                        self._sync(handle)
+                except Exception:
+                    pass
+                finally:
+                    handle.lock.release()
+
+    def health(self) -> List[dict]:
+        out = []
+        for h in self._handles:
+            busy = not h.lock.acquire(blocking=False)
+            alive = h.process is not None and h.process.is_alive()
+            latency_ms = None
+            if not busy:
+                try:
+                    if alive:
+                        t0 = time.perf_counter()
+                        h.conn.send(("ping",))
+                        self._recv(h, expect="pong")
+                        latency_ms = 1000.0 * (time.perf_counter() - t0)
+                except Exception:
+                    alive = False
+                finally:
+                    h.lock.release()
+            out.append({
+                "worker": h.index,
+                "pid": h.process.pid if h.process is not None else None,
+                "alive": alive,
+                "busy": busy,
+                "checkpoint_version": h.version,
+                "up_to_date": h.generation == self._generation,
+                "restarts": h.restarts,
+                "ping_ms": latency_ms,
+            })
+        return out
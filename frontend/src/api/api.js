@@ -5,4 +5,42 @@ const api = axios.create({
   headers: { "Content-Type": "application/json" },
 });
 
+// Бінарний формат (опційно, JSON лишається за замовчуванням):
+// X — little-endian float32, Y — uint8 одразу після X; відповідь predict — 441 байт (21x21 по рядках).
+const BINARY = { "Content-Type": "application/octet-stream" };
+
+const toFloat32 = (xs) => {
+  const buf = new ArrayBuffer(xs.length * 4);
+  const view = new DataView(buf);
+  xs.forEach((v, i) => view.setFloat32(i * 4, Number(v), true)); // true — little-endian
+  return new Uint8Array(buf);
+};
+
+const toMatrix = (bytes, rows = 21, cols = 21) =>
+  Array.from({ length: rows }, (_, r) => Array.from(bytes.subarray(r * cols, (r + 1) * cols)));
+
+// → { predicted: 21x21 }, як у JSON-відповіді /api/predict
+export async function predictBinary(X_data, { decode_mode = "greedy", iterations } = {}) {
+  const res = await api.post("/api/predict/binary", toFloat32(X_data), {
+    headers: BINARY,
+    params: { decode_mode, ...(iterations ? { iterations } : {}) },
+    responseType: "arraybuffer",
+  });
+  return { predicted: toMatrix(new Uint8Array(res.data)) };
+}
+
+// → та сама відповідь, що й /api/train
+export async function trainBinary({ X_data, Y_data, epochs = 300, lr = 0.001 }) {
+  const x = toFloat32(X_data);
+  const y = Y_data ? Uint8Array.from(Y_data) : new Uint8Array(0);
+  const body = new Uint8Array(x.length + y.length);
+  body.set(x, 0);
+  body.set(y, x.length);
+  const res = await api.post("/api/train/binary", body, {
+    headers: BINARY,
+    params: { x_len: X_data.length, epochs, lr },
+  });
+  return res.data;
+}
+
 export default api;
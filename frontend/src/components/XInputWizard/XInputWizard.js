@@ -6,7 +6,8 @@ import { X_SCHEMA, EXPECTED_LEN, buildDefaultValuesFromSchema } from "./x_schema
 import { buildXFromSchema } from "./buildX";
 import { Button } from "react-bootstrap";
 
-export default function XInputWizard({ onBuilt }) {
+// padTo — довжина X (за замовчуванням EXPECTED_LEN); null — X природної довжини схеми, без нулів у хвості
+export default function XInputWizard({ onBuilt, padTo = EXPECTED_LEN }) {
   const groups = X_SCHEMA;
 
   // базове нульове значення для всіх полів
@@ -40,7 +41,7 @@ export default function XInputWizard({ onBuilt }) {
   };
 
   const buildX = () => {
-    const X = buildXFromSchema(groups, valuesByGroup, EXPECTED_LEN);
+    const X = buildXFromSchema(groups, valuesByGroup, padTo);
     onBuilt?.(X);
   };
 
@@ -5,7 +5,9 @@ import { EXPECTED_LEN } from "./x_schema";
  * Збирає X вектор з форми за схемою.
  * - ігнорує поля з noX
  * - підтримує bool/int/float/percent/select
- * - завжди повертає масив довжини expectedLen (дефолт 441)
+ * - повертає масив довжини expectedLen (дефолт 441)
+ * - expectedLen = null — без доповнення/обрізання: довжина = max(xIndex) + 1
+ *   (бекенд приймає X змінної довжини, короткий X не платить за 441 позицію уваги)
  */
 export function buildXFromSchema(schema, valuesByGroup, expectedLen = EXPECTED_LEN) {
   // валідні індекси лише для полів, що йдуть у X
@@ -15,7 +17,7 @@ export function buildXFromSchema(schema, valuesByGroup, expectedLen = EXPECTED_L
     .map(f => f.xIndex);
 
   const maxIdx = indices.length ? Math.max(...indices) : -1;
-  const size = Math.max(expectedLen, maxIdx + 1);
+  const size = expectedLen == null ? maxIdx + 1 : Math.max(expectedLen, maxIdx + 1);
 
   const X = new Array(size).fill(0);
 
@@ -84,6 +86,7 @@ export function buildXFromSchema(schema, valuesByGroup, expectedLen = EXPECTED_L
   }
 
   // нормалізувати довжину до expectedLen
+  if (expectedLen == null) return X;
   if (X.length > expectedLen) return X.slice(0, expectedLen);
   if (X.length < expectedLen) return X.concat(new Array(expectedLen - X.length).fill(0));
   return X;